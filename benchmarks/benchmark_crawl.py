@@ -0,0 +1,130 @@
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import jidownloader
+from datamanager import dbmanager
+from datamanager.dbmanager import DBManager
+from datamanager.mongomanager import MongoDBManager
+from datamanager.fieldcache import FieldCache
+from downloader import jiradownloader
+from downloader.jiradownloader import JiraDownloader
+from downloader.ratelimiter import RateLimiter
+from logger.downloadlogger import Logger
+from stubserver.jirastubserver import JiraStubServer
+from properties import JiraRequestBurst, JiraConnectionPoolSize, JiraConcurrentRequests, JiraStreamPages
+
+# The database where the benchmark writes when the storage is MongoDB, which is dropped before and after each run
+benchmark_database_name = "jibenchmark"
+
+class StageTimer:
+	"""
+	Class that measures the total time spent in each stage of a crawl, by wrapping the functions of
+	the stages. The stages run in different threads, so their times may add up to more than the
+	elapsed time of the crawl.
+	"""
+	def __init__(self):
+		"""
+		Initializes this timer.
+		"""
+		self.times = {}
+		self.lock = threading.Lock()
+
+	def wrap(self, stage, function):
+		"""
+		Wraps a function so that its time is added to the time of a stage.
+
+		:param stage: the name of the stage.
+		:param function: the function.
+		:returns: the wrapped function.
+		"""
+		def timed_function(*args, **kwargs):
+			start = time.perf_counter()
+			try:
+				return function(*args, **kwargs)
+			finally:
+				with self.lock:
+					self.times[stage] = self.times.get(stage, 0) + time.perf_counter() - start
+		return timed_function
+
+def create_db_manager(storage, foldername):
+	"""
+	Creates an empty DB manager for the benchmark.
+
+	:param storage: either "disk" for DBManager or "mongo" for MongoDBManager.
+	:param foldername: the folder where the disk storage writes.
+	:returns: the DB manager.
+	"""
+	if storage == "mongo":
+		db = MongoDBManager(benchmark_database_name)
+		db.client.drop_database(benchmark_database_name)
+		return db
+	# The disk storage writes under the folder of its module
+	dbmanager.dataFolderPath = foldername
+	return DBManager()
+
+def run_benchmark(storage, jira_url, project_name, number_of_issues, requests_per_second):
+	"""
+	Crawls a project of a stub server using download_project and measures the crawl. This function is
+	run in a separate process, so that the peak memory of the process is the peak memory of the crawl.
+
+	:param storage: either "disk" for DBManager or "mongo" for MongoDBManager.
+	:param jira_url: the API URL of the stub server.
+	:param project_name: the name of the crawled project.
+	:param number_of_issues: the number of issues of the project.
+	:param requests_per_second: the maximum number of requests per second of the crawler.
+	:returns: a dict containing the elapsed time, the issues per second, the peak RSS, and the time of each stage.
+	"""
+	foldername = tempfile.mkdtemp(prefix = "jibenchmark")
+	# Point the crawler to the stub server, keeping the fields of the stub only in memory
+	jidownloader.JiraAPI = jira_url
+	jidownloader.field_cache = FieldCache(None, 86400)
+	db = create_db_manager(storage, foldername)
+	jd = JiraDownloader(jira_url, ("benchmark", "benchmark"), rate_limiter = RateLimiter(requests_per_second, JiraRequestBurst), pool_size = JiraConnectionPoolSize,
+						max_concurrent_requests = JiraConcurrentRequests, stream_pages = JiraStreamPages)
+	timer = StageTimer()
+	jd.send_request = timer.wrap("download", jd.send_request)
+	jiradownloader.decode_json = timer.wrap("decode", jiradownloader.decode_json)
+	jidownloader.process_issue = timer.wrap("process", jidownloader.process_issue)
+	for entity in ("info", "issue", "user", "event", "comment", "worklog", "cursor"):
+		method = "write_project_" + entity + "_to_disk"
+		setattr(db, method, timer.wrap("write", getattr(db, method)))
+	db.finalize_write_to_disk = timer.wrap("finalize", db.finalize_write_to_disk)
+	try:
+		start = time.perf_counter()
+		jidownloader.download_project(project_name, db, Logger(0), jd)
+		elapsed = time.perf_counter() - start
+	finally:
+		shutil.rmtree(foldername, ignore_errors = True)
+		if storage == "mongo":
+			db.client.drop_database(benchmark_database_name)
+	# The maximum resident set size is given in kilobytes on Linux
+	return {"elapsed": elapsed, "issues_per_second": number_of_issues / elapsed, "stages": timer.times,
+			"peak_rss_in_MB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "Measures the throughput of crawling a synthetic project of the stub server.")
+	parser.add_argument("--issues", type = int, default = 2000, help = "the number of issues of the crawled project")
+	parser.add_argument("--storage", nargs = "+", default = ["disk", "mongo"], choices = ["disk", "mongo"], help = "the storages that are measured")
+	parser.add_argument("--rate", type = float, default = 1000, help = "the maximum number of requests per second of the crawler")
+	parser.add_argument("--latency", type = float, default = 0, help = "the latency of each response of the stub server in milliseconds")
+	parser.add_argument("--throttle", type = float, default = 0, help = "the ratio of the requests that the stub server responds with HTTP 429")
+	parser.add_argument("--retry-after", type = int, default = None, help = "the value of the Retry-After header of throttled responses in seconds")
+	args = parser.parse_args()
+	with JiraStubServer({"BENCH": args.issues}, latency_in_seconds = args.latency / 1000, throttle_ratio = args.throttle, retry_after_in_seconds = args.retry_after) as stub:
+		for storage in args.storage:
+			num_requests, num_throttled_requests = stub.num_requests, stub.num_throttled_requests
+			try:
+				with ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context("spawn")) as executor:
+					result = executor.submit(run_benchmark, storage, stub.jira_url, "BENCH", args.issues, args.rate).result()
+			except BaseException as e:
+				print("%-5s skipped (%s)" % (storage, str(e).strip().splitlines()[-1] if str(e).strip() else type(e).__name__))
+				continue
+			print("%-5s %d issues in %.2f s: %.1f issues/sec, peak RSS %.1f MB, %d requests (%d throttled)" % (storage, args.issues, result["elapsed"],
+				  result["issues_per_second"], result["peak_rss_in_MB"], stub.num_requests - num_requests, stub.num_throttled_requests - num_throttled_requests))
+			for stage in ("download", "decode", "process", "write", "finalize"):
+				print("      %-8s %7.2f s" % (stage, result["stages"].get(stage, 0)))
@@ -0,0 +1,44 @@
+import sys
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+from dateutil.parser import parse
+from helpers import parse_datetime
+
+def create_corpus(size, seed = 0):
+	"""
+	Creates a corpus of datetime strings in the format of the Jira API. Most of them are in UTC, as
+	in the Apache Jira, while the rest have other offsets, and they all have millisecond precision.
+
+	:param size: the number of datetime strings.
+	:param seed: the seed of the random generator.
+	:returns: a list containing the datetime strings.
+	"""
+	rng = random.Random(seed)
+	offsets = [timezone.utc] * 8 + [timezone(timedelta(hours = 1)), timezone(timedelta(hours = -7)), timezone(timedelta(hours = 5, minutes = 30))]
+	corpus = []
+	for _ in range(size):
+		value = datetime(2002, 1, 1, tzinfo = rng.choice(offsets)) + timedelta(seconds = rng.randrange(700000000), milliseconds = rng.randrange(1000))
+		corpus.append(value.strftime("%Y-%m-%dT%H:%M:%S.") + "%03d" % (value.microsecond // 1000) + value.strftime("%z"))
+	return corpus
+
+def benchmark(function, corpus, repeat = 5):
+	"""
+	Measures the time of parsing a corpus with a function.
+
+	:param function: the parsing function.
+	:param corpus: the datetime strings.
+	:param repeat: the number of repetitions, the fastest of which is kept.
+	:returns: the time per parsed string in microseconds.
+	"""
+	return min(timeit.repeat(lambda: [function(value) for value in corpus], number = 1, repeat = repeat)) / len(corpus) * 1e6
+
+if __name__ == "__main__":
+	corpus = create_corpus(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
+	mismatches = sum(1 for value in corpus if parse_datetime(value) != parse(value))
+	dateutil_time = benchmark(parse, corpus)
+	jira_time = benchmark(parse_datetime, corpus)
+	print("Parsed %d datetime strings (%d mismatches)" % (len(corpus), mismatches))
+	print("dateutil.parser.parse: %8.2f us per string" % dateutil_time)
+	print("helpers.parse_datetime: %7.2f us per string" % jira_time)
+	print("Speedup: %.1fx" % (dateutil_time / jira_time))
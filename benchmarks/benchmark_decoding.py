@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import timeit
+import requests
+from downloader.jsondecoder import decode_json, orjson
+from stubserver.jirastubserver import JiraStubServer
+
+def create_pages(number_of_pages, per_page = 50):
+	"""
+	Creates pages of issues as returned by the search of the Jira API (including their changelogs),
+	using the synthetic issues of the stub server.
+
+	:param number_of_pages: the number of pages.
+	:param per_page: the number of issues per page.
+	:returns: a list containing the encoded pages.
+	"""
+	stub = JiraStubServer({"BENCH": number_of_pages * per_page})
+	stub.jira_url = "http://localhost/rest/api/2/"
+	return [json.dumps(stub.search("project=BENCH", start_at, per_page, None, "changelog")).encode("utf-8")
+			for start_at in range(0, number_of_pages * per_page, per_page)]
+
+def read_pages(foldername):
+	"""
+	Reads recorded pages, i.e. the bodies of responses of the Jira API that are saved as files.
+
+	:param foldername: the folder of the recorded pages.
+	:returns: a list containing the encoded pages.
+	"""
+	pages = []
+	for filename in sorted(os.listdir(foldername)):
+		with open(os.path.join(foldername, filename), 'rb') as infile:
+			pages.append(infile.read())
+	return pages
+
+def create_response(content):
+	"""
+	Creates a response of the requests library with the given body, as sent by the Jira API.
+
+	:param content: the body of the response.
+	:returns: the response object.
+	"""
+	r = requests.models.Response()
+	r.status_code = 200
+	r.headers["Content-Type"] = "application/json;charset=UTF-8"
+	r._content = content
+	return r
+
+def benchmark(function, responses, repeat = 5):
+	"""
+	Measures the time of decoding responses with a function.
+
+	:param function: the decoding function.
+	:param responses: the responses.
+	:param repeat: the number of repetitions, the fastest of which is kept.
+	:returns: the time per megabyte of responses in milliseconds.
+	"""
+	size = sum(len(r.content) for r in responses) / 1024 / 1024
+	return min(timeit.repeat(lambda: [function(r) for r in responses], number = 1, repeat = repeat)) / size * 1e3
+
+if __name__ == "__main__":
+	if len(sys.argv) > 1 and os.path.isdir(sys.argv[1]):
+		pages = read_pages(sys.argv[1])
+	else:
+		pages = create_pages(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
+	responses = [create_response(page) for page in pages]
+	mismatches = sum(1 for r in responses if decode_json(r.content) != json.loads(r.text))
+	text_time = benchmark(lambda r: json.loads(r.text or r.content), responses)
+	bytes_time = benchmark(lambda r: json.loads(r.content), responses)
+	decode_time = benchmark(lambda r: decode_json(r.content), responses)
+	print("Decoded %d pages of %.1f MB (%d mismatches)" % (len(pages), sum(len(page) for page in pages) / 1024 / 1024, mismatches))
+	print("%-22s %6.2f ms per MB" % ("json.loads(r.text):", text_time))
+	print("%-22s %6.2f ms per MB" % ("json.loads(r.content):", bytes_time))
+	print("%-22s %6.2f ms per MB" % ("decode_json (" + ("orjson" if orjson != None else "json") + "):", decode_time))
+	print("Speedup: %.1fx" % (text_time / decode_time))
@@ -0,0 +1,46 @@
+import sys
+from downloader.ratelimiter import RateLimiter, get_request_class
+
+jira_url = "http://localhost/rest/api/2/"
+
+def simulate(responses, requests_per_second = 0.5):
+	"""
+	Feeds a sequence of responses to a new rate limiter, without sending any request.
+
+	:param responses: a list of tuples containing the URL, the status code, and the latency of each response.
+	:param requests_per_second: the maximum number of requests per second of the limiter.
+	:returns: the rate limiter after the responses.
+	"""
+	rate_limiter = RateLimiter(requests_per_second)
+	for url, status_code, latency in responses:
+		rate_limiter.record_response(status_code, latency, None, get_request_class(url, jira_url))
+	return rate_limiter
+
+def crawl_responses(number_of_pages, page_latency, small_latency = 0.1):
+	"""
+	Returns the responses of a crawl of a project, i.e. a few fast requests (credentials, fields,
+	project, and count) followed by pages of issues.
+
+	:param number_of_pages: the number of pages of issues.
+	:param page_latency: the latency of each page of issues.
+	:param small_latency: the latency of the requests before the pages.
+	:returns: a list of tuples containing the URL, the status code, and the latency of each response.
+	"""
+	responses = [(jira_url + "project", 200, small_latency), (jira_url + "field", 200, small_latency),
+				 (jira_url + "project/MYPROJECT?maxResults=50", 200, small_latency), (jira_url + "search?jql=project=MYPROJECT&maxResults=1", 200, small_latency)]
+	return responses + [(jira_url + "search?jql=project=MYPROJECT&maxResults=50&startAt=" + str(50 * i), 200, page_latency) for i in range(number_of_pages)]
+
+if __name__ == "__main__":
+	scenarios = [
+		("steady pages after fast requests", crawl_responses(200, 1.5), True),
+		("pages getting 5x slower", crawl_responses(50, 0.3) + crawl_responses(10, 1.5)[4:], False),
+		("pages getting 5x slower, then steady", crawl_responses(50, 0.3) + crawl_responses(300, 1.5)[4:], True),
+		("throttled pages, then steady", crawl_responses(50, 1.5) + [(jira_url + "search?maxResults=50", 429, 0.1)] * 3 + crawl_responses(50, 1.5)[4:], True),
+	]
+	failures = 0
+	for name, responses, expect_max_rate in scenarios:
+		rate_limiter = simulate(responses)
+		ok = (rate_limiter.rate == rate_limiter.max_rate) == expect_max_rate
+		failures += 0 if ok else 1
+		print("%-40s rate %.3f of %.3f (%s)" % (name + ":", rate_limiter.rate, rate_limiter.max_rate, "ok" if ok else "UNEXPECTED"))
+	sys.exit(1 if failures > 0 else 0)
@@ -5,6 +5,7 @@ if __name__ == "__main__":
 	client = pymongo.MongoClient(database_host_and_port)
 	db = client["jidata"]
 	db["issues"].create_index('projectname')
+	db["issues"].create_index([('projectname', pymongo.ASCENDING), ('updated', pymongo.DESCENDING)])
 	db["users"].create_index('projectname')
 	db["comments"].create_index('issue')
 	db["comments"].create_index('projectname')
@@ -0,0 +1,124 @@
+import time
+import threading
+from logger.metrics import metrics
+from properties import num_bulk_operations, bulk_flush_interval_in_seconds
+
+class BulkWriter:
+	"""
+	Class that implements a buffered writer for MongoDB. Write operations are grouped per collection
+	and are sent as unordered bulks, either when a collection gathers max_operations operations or
+	when the oldest buffered operation is older than max_delay_in_seconds. The latter is enforced by
+	a timer thread, so that the operations are sent also when no other operations are added (e.g. while
+	a page is downloaded); an exception of a bulk that is sent by the timer thread is raised by the next
+	call of add or flush. The method flush must be called to send any remaining operations.
+	"""
+	def __init__(self, max_operations = num_bulk_operations, max_delay_in_seconds = bulk_flush_interval_in_seconds):
+		"""
+		Initializes this bulk writer.
+
+		:param max_operations: the number of operations of a collection that are sent as a bulk.
+		:param max_delay_in_seconds: the maximum time that an operation is kept in the buffer.
+		"""
+		self.max_operations = max_operations
+		self.max_delay_in_seconds = max_delay_in_seconds
+		self.collections = {}
+		self.operations = {}
+		self.first_operation_time = None
+		self.lock = threading.RLock()
+		self.timer = None
+		self.error = None
+
+	def add(self, collection, operation):
+		"""
+		Adds a write operation (e.g. UpdateOne) to the buffer of a collection.
+
+		:param collection: the collection in which the operation is performed.
+		:param operation: the operation to be performed.
+		"""
+		with self.lock:
+			self.raise_error()
+			self.collections[collection.name] = collection
+			operations = self.operations.setdefault(collection.name, [])
+			operations.append(operation)
+			if self.first_operation_time == None:
+				self.first_operation_time = time.monotonic()
+			if len(operations) >= self.max_operations:
+				self.flush_collection(collection.name)
+			if self.first_operation_time != None and time.monotonic() - self.first_operation_time >= self.max_delay_in_seconds:
+				self.flush()
+			if self.first_operation_time != None and self.timer == None:
+				self.start_timer(self.max_delay_in_seconds)
+
+	def start_timer(self, delay_in_seconds):
+		"""
+		Starts the timer thread that sends the buffered operations when the oldest of them is due.
+
+		:param delay_in_seconds: the time after which the timer thread checks the buffered operations.
+		"""
+		self.timer = threading.Timer(delay_in_seconds, self.flush_if_due)
+		self.timer.daemon = True
+		self.timer.start()
+
+	def flush_if_due(self):
+		"""
+		Sends the buffered operations if the oldest of them is older than max_delay_in_seconds, or restarts
+		the timer thread for the time left otherwise. It is called by the timer thread.
+		"""
+		with self.lock:
+			self.timer = None
+			if self.first_operation_time == None or self.error != None:
+				return
+			delay = self.max_delay_in_seconds - (time.monotonic() - self.first_operation_time)
+			if delay > 0:
+				self.start_timer(delay)
+				return
+			try:
+				self.flush()
+			except Exception as e:
+				self.error = e
+
+	def raise_error(self):
+		"""
+		Raises the exception of a bulk that was sent by the timer thread, if any.
+		"""
+		if self.error != None:
+			error = self.error
+			self.error = None
+			raise error
+
+	def flush_collection(self, collection_name):
+		"""
+		Sends the buffered operations of a collection, recording the number of operations and the time of
+		the round trip to the database in the metrics.
+
+		:param collection_name: the name of the collection.
+		"""
+		with self.lock:
+			operations = self.operations.pop(collection_name, [])
+			if len(operations) > 0:
+				start = time.monotonic()
+				self.collections[collection_name].bulk_write(operations, ordered = False)
+				metrics.increment("jidownloader_documents_written_total", len(operations), collection = collection_name)
+				metrics.observe("jidownloader_write_duration_seconds", time.monotonic() - start, collection = collection_name)
+			if len(self.operations) == 0:
+				self.first_operation_time = None
+
+	def flush(self):
+		"""
+		Sends the buffered operations of all collections, raising the exception of a bulk that was sent
+		by the timer thread, if any.
+		"""
+		with self.lock:
+			self.raise_error()
+			for collection_name in list(self.operations):
+				self.flush_collection(collection_name)
+			self.first_operation_time = None
+
+	def pending_operations(self):
+		"""
+		Returns the number of buffered operations.
+
+		:returns: the number of operations that have not been sent yet.
+		"""
+		with self.lock:
+			return sum(len(operations) for operations in self.operations.values())
@@ -1,10 +1,20 @@
 from pymongo import UpdateOne
-from properties import num_bulk_operations
 
 class DatabaseManager:
 	"""
 	Class that implements a database manager. It includes functions for a MongoDB database.
 	"""
+	def update_one_buffered(self, collection, document, upsert = False):
+		"""
+		Perform an update operation through the bulk writer of this manager (self.bulk_writer).
+		The operation is sent to the database along with other operations of the same collection.
+
+		:param collection: the collection in which the document is updated.
+		:param document: the document to be updated.
+		:param upsert: set to True to perform an insert if no documents match the filter.
+		"""
+		self.bulk_writer.add(collection, UpdateOne({"_id": document["_id"]}, {"$set": document}, upsert = upsert))
+
 	def update_multiple(self, collection, documents, upsert = False):
 		"""
 		Perform multiple update operations in bulk.
@@ -13,11 +23,6 @@ class DatabaseManager:
 		:param documents: the documents to be updated.
 		:param upsert: set to True to perform an insert if no documents match the filter.
 		"""
-		operations = []
 		for document in documents:
-			operations.append(UpdateOne({"_id": document["_id"]}, {"$set": document}, upsert = upsert))
-			if len(operations) == num_bulk_operations:
-				collection.bulk_write(operations, ordered = False)
-				operations = []
-		if len(operations) > 0:
-			collection.bulk_write(operations, ordered = False)
+			self.update_one_buffered(collection, document, upsert = upsert)
+		self.bulk_writer.flush()
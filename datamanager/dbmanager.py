@@ -1,7 +1,11 @@
 import os
-from datamanager.project import Project
+import json
+import time
+from datetime import datetime
+from datamanager.project import Project, LazyProject
 from datamanager.filemanager import FileManager
-from properties import dataFolderPath, always_write_to_disk
+from logger.metrics import metrics
+from properties import dataFolderPath, always_write_to_disk, disk_read_workers
 
 class DBManager(FileManager):
 	"""
@@ -9,11 +13,15 @@ class DBManager(FileManager):
 	initialize_write_to_disk, then optionally call any other method for writing data to
 	disk, and finally call the method finalize_write_to_disk.
 	"""
+	entities = ["issues", "users", "events", "comments", "worklogs"]
+
 	def __init__(self):
 		"""
 		Initializes this DB manager.
 		"""
 		self.create_folder_if_it_does_not_exist(dataFolderPath)
+		self.manifests = {}
+		self.manifest_updates = {}
 
 	def initialize_write_to_disk(self, project_name):
 		"""
@@ -27,22 +35,98 @@ class DBManager(FileManager):
 		self.create_folder_if_it_does_not_exist(os.path.join(rootfolder, "users"))
 		self.create_folder_if_it_does_not_exist(os.path.join(rootfolder, "events"))
 		self.create_folder_if_it_does_not_exist(os.path.join(rootfolder, "comments"))
+		self.create_folder_if_it_does_not_exist(os.path.join(rootfolder, "worklogs"))
+		self.manifests[project_name] = self.read_manifest(project_name)
+		self.manifest_updates[project_name] = []
+		if os.path.exists(os.path.join(rootfolder, "manifest.log")) or not os.path.exists(os.path.join(rootfolder, "manifest.json")):
+			# The manifest is written before the crawl (moving the records of an interrupted crawl from the manifest log to the manifest),
+			# so that the manifest log of this crawl is added to a manifest that exists and the files are never read to rebuild it
+			self.write_manifest(project_name, self.manifests[project_name])
+
+	def read_manifest(self, project_name):
+		"""
+		Reads the manifest of a project, that is a file containing the ids of the records of each entity
+		of the project and the update datetimes of its issues, so that the project can be checked for
+		existing records without reading them. If the manifest does not exist (e.g. for projects that
+		were downloaded before manifests were introduced), then it is built from the files of the project.
+		The records that were written by an interrupted crawl up to its last cursor are read from the
+		manifest log of the project and added to the manifest.
+
+		:param project_name: the name of the project.
+		:returns: a dict containing the entities as keys and dicts of ids to update datetimes (or None) as values.
+		"""
+		rootfolder = os.path.join(dataFolderPath, project_name)
+		manifest = self.read_json_from_file_if_it_exists(os.path.join(rootfolder, "manifest.json"))
+		if not manifest:
+			for entity in self.entities:
+				folder = os.path.join(rootfolder, entity)
+				manifest[entity] = {filename[:-len(".json")]: None for filename in os.listdir(folder)} if os.path.exists(folder) else {}
+			if len(manifest["issues"]) > 0:
+				issues = self.read_jsons_from_folder(os.path.join(rootfolder, "issues"), "id", disk_read_workers)
+				manifest["issues"] = {str(issue["id"]): issue.get("updated") for issue in issues.values()}
+		if os.path.exists(os.path.join(rootfolder, "manifest.log")):
+			with open(os.path.join(rootfolder, "manifest.log"), 'r', encoding = 'utf-8') as infile:
+				for line in infile:
+					try:
+						entity, record_id, updated = json.loads(line)
+					except ValueError:
+						# The last line may be partially written if the crawl was killed while appending it
+						break
+					manifest[entity][record_id] = updated
+		return manifest
+
+	def write_manifest(self, project_name, manifest):
+		"""
+		Writes the manifest of a project, replacing the previous one atomically, and removes its manifest log.
+
+		:param project_name: the name of the project.
+		:param manifest: the manifest to be written to disk.
+		"""
+		rootfolder = os.path.join(dataFolderPath, project_name)
+		self.write_json_to_file(os.path.join(rootfolder, "manifest.json.tmp"), manifest)
+		os.replace(os.path.join(rootfolder, "manifest.json.tmp"), os.path.join(rootfolder, "manifest.json"))
+		if os.path.exists(os.path.join(rootfolder, "manifest.log")):
+			os.remove(os.path.join(rootfolder, "manifest.log"))
+
+	def add_to_manifest(self, project_name, entity, record_id, updated = None):
+		"""
+		Adds a record to the manifest of a project.
+
+		:param project_name: the name of the project.
+		:param entity: the entity of the record (issues, users, events, comments, or worklogs).
+		:param record_id: the id of the record.
+		:param updated: the update datetime of the record, if any.
+		"""
+		if updated != None and not isinstance(updated, str):
+			updated = str(updated)[:-6]
+		self.manifests[project_name][entity][str(record_id)] = updated
+		self.manifest_updates[project_name].append((entity, str(record_id), updated))
 
-	def read_project_from_disk(self, project_name):
+	def read_project_from_disk(self, project_name, lazy = True):
 		"""
 		Reads a project from disk given the name of the project that is also the folder
-		of the project.
+		of the project. By default, the project is read lazily from its manifest, that is
+		only its info, the keys of its users, and the update datetime of its last updated
+		issue are loaded. Otherwise, all the records of the project are read in parallel.
 
 		:param project_name: the name of the project to be read from disk.
-		:returns: an object of type Project.
+		:param lazy: set to False to read all the records of the project.
+		:returns: an object of type LazyProject, or an object of type Project if lazy is False.
 		"""
-		project = Project()
 		rootfolder = os.path.join(dataFolderPath, project_name)
+		if lazy:
+			manifest = self.manifests.get(project_name) or self.read_manifest(project_name)
+			issues_updated = [updated for updated in manifest["issues"].values() if updated != None]
+			project = LazyProject(datetime.fromisoformat(max(issues_updated)) if len(issues_updated) > 0 else None, list(manifest["users"]))
+			project["info"] = self.read_json_from_file_if_it_exists(os.path.join(rootfolder, "info.json"))
+			return project
+		project = Project()
 		project["info"] = self.read_json_from_file_if_it_exists(os.path.join(rootfolder, "info.json"))
-		project["issues"] = self.read_jsons_from_folder(os.path.join(rootfolder, "issues"), "id")
-		project["users"] = self.read_jsons_from_folder(os.path.join(rootfolder, "users"), "id")
-		project["events"] = self.read_jsons_from_folder(os.path.join(rootfolder, "events"), "id")
-		project["comments"] = self.read_jsons_from_folder(os.path.join(rootfolder, "comments"), "id")
+		project["issues"] = self.read_jsons_from_folder(os.path.join(rootfolder, "issues"), "id", disk_read_workers)
+		project["users"] = self.read_jsons_from_folder(os.path.join(rootfolder, "users"), "id", disk_read_workers)
+		project["events"] = self.read_jsons_from_folder(os.path.join(rootfolder, "events"), "id", disk_read_workers)
+		project["comments"] = self.read_jsons_from_folder(os.path.join(rootfolder, "comments"), "id", disk_read_workers)
+		project["worklogs"] = self.read_jsons_from_folder(os.path.join(rootfolder, "worklogs"), "id", disk_read_workers)
 		return project
 
 	def project_exists(self, project_name):
@@ -57,7 +141,8 @@ class DBManager(FileManager):
 
 	def finalize_write_to_disk(self, project_name, project, crawldatetime, lastcrawlcomplete):
 		"""
-		Finalizes the writing of a project to disk. Closes any open buffers.
+		Finalizes the writing of a project to disk. Writes its manifest and closes any open buffers.
+		If the crawl is complete, then the cursor of the crawl is removed.
 
 		:param project_name: the name of the project to be written to disk.
 		:param project: the project data to be written to disk.
@@ -69,16 +154,66 @@ class DBManager(FileManager):
 			self.write_json_to_file(os.path.join(rootfolder, "info.json"), project["info"])
 			for issue in project["issues"].values():
 				self.write_json_to_file(os.path.join(rootfolder, "issues", str(issue["id"]) + ".json"), issue)
+				self.add_to_manifest(project_name, "issues", issue["id"], issue.get("updated"))
 			for user in project["users"].values():
 				self.write_json_to_file(os.path.join(rootfolder, "users", str(user["key"]) + ".json"), user)
+				self.add_to_manifest(project_name, "users", user["key"])
 			for event in project["events"].values():
 				self.write_json_to_file(os.path.join(rootfolder, "events", str(event["id"]) + ".json"), event)
+				self.add_to_manifest(project_name, "events", event["id"])
 			for comment in project["comments"].values():
 				self.write_json_to_file(os.path.join(rootfolder, "comments", str(comment["id"]) + ".json"), comment)
+				self.add_to_manifest(project_name, "comments", comment["id"])
+			for worklog in project["worklogs"].values():
+				self.write_json_to_file(os.path.join(rootfolder, "worklogs", str(worklog["id"]) + ".json"), worklog)
+				self.add_to_manifest(project_name, "worklogs", worklog["id"])
 		project["info"]["lastcrawlcomplete"] = lastcrawlcomplete
 		project["info"]["lastcrawled"] = crawldatetime
 		rootfolder = os.path.join(dataFolderPath, project_name)
+		self.write_manifest(project_name, self.manifests.pop(project_name))
+		self.manifest_updates.pop(project_name, None)
 		self.write_json_to_file(os.path.join(rootfolder, "info.json"), project["info"])
+		if lastcrawlcomplete and os.path.exists(os.path.join(rootfolder, "cursor.json")):
+			os.remove(os.path.join(rootfolder, "cursor.json"))
+
+	def read_project_issues_updated(self, project_name, issue_ids = None):
+		"""
+		Reads the update datetimes of the stored issues of a project, as they are kept in its manifest.
+
+		:param project_name: the name of the project.
+		:param issue_ids: the ids of the issues, default is all the stored issues of the project.
+		:returns: a dict containing the ids of the stored issues as keys and their update datetimes as values.
+		"""
+		manifest = self.manifests[project_name]["issues"]
+		if issue_ids == None:
+			return dict(manifest)
+		return {issue_id: manifest[str(issue_id)] for issue_id in issue_ids if str(issue_id) in manifest}
+
+	def read_project_cursor(self, project_name):
+		"""
+		Reads the cursor of the last crawl of a project, if the crawl was interrupted.
+
+		:param project_name: the name of the project.
+		:returns: the cursor as a dict, or None if there is no cursor.
+		"""
+		return self.read_json_from_file_if_it_exists(os.path.join(dataFolderPath, project_name, "cursor.json")) or None
+
+	def write_project_cursor_to_disk(self, project_name, cursor):
+		"""
+		Writes the cursor of the crawl of a project to disk, so that an interrupted crawl can be
+		resumed from the cursor. The records that were added to the manifest since the previous cursor
+		are first appended to the manifest log of the project, so that the manifest of an interrupted
+		crawl is not rebuilt from the files of the project.
+
+		:param project_name: the name of the project.
+		:param cursor: the cursor to be written to disk.
+		"""
+		if always_write_to_disk:
+			rootfolder = os.path.join(dataFolderPath, project_name)
+			with open(os.path.join(rootfolder, "manifest.log"), 'a', encoding = 'utf-8') as outfile:
+				outfile.writelines(json.dumps(update) + "\n" for update in self.manifest_updates[project_name])
+			self.manifest_updates[project_name] = []
+			self.write_json_to_file(os.path.join(rootfolder, "cursor.json"), cursor)
 
 	def write_project_info_to_disk(self, project_name, info):
 		"""
@@ -91,6 +226,23 @@ class DBManager(FileManager):
 			rootfolder = os.path.join(dataFolderPath, project_name)
 			self.write_json_to_file(os.path.join(rootfolder, "info.json"), info)
 
+	def write_record_to_file(self, project_name, entity, record_id, record, updated = None):
+		"""
+		Writes a record of a project to its file and adds it to the manifest of the project. The written
+		record and the time of writing it are recorded in the metrics.
+
+		:param project_name: the name of the project.
+		:param entity: the name of the entity of the record (e.g. issues).
+		:param record_id: the id of the record.
+		:param record: the record to be written to disk.
+		:param updated: the update datetime of the record (for issues).
+		"""
+		start = time.monotonic()
+		self.write_json_to_file(os.path.join(dataFolderPath, project_name, entity, str(record_id) + ".json"), record)
+		metrics.increment("jidownloader_documents_written_total", collection = entity)
+		metrics.observe("jidownloader_write_duration_seconds", time.monotonic() - start, collection = entity)
+		self.add_to_manifest(project_name, entity, record_id, updated)
+
 	def write_project_issue_to_disk(self, project_name, issue):
 		"""
 		Writes an issue of a project to disk.
@@ -99,8 +251,7 @@ class DBManager(FileManager):
 		:param issue: the issue to be written to disk.
 		"""
 		if always_write_to_disk:
-			rootfolder = os.path.join(dataFolderPath, project_name)
-			self.write_json_to_file(os.path.join(rootfolder, "issues", str(issue["id"]) + ".json"), issue)
+			self.write_record_to_file(project_name, "issues", issue["id"], issue, issue["updated"])
 
 	def write_project_user_to_disk(self, project_name, user):
 		"""
@@ -110,8 +261,7 @@ class DBManager(FileManager):
 		:param user: the user to be written to disk.
 		"""
 		if always_write_to_disk:
-			rootfolder = os.path.join(dataFolderPath, project_name)
-			self.write_json_to_file(os.path.join(rootfolder, "users", str(user["key"]) + ".json"), user)
+			self.write_record_to_file(project_name, "users", user["key"], user)
 
 	def write_project_event_to_disk(self, project_name, event):
 		"""
@@ -121,8 +271,7 @@ class DBManager(FileManager):
 		:param event: the event to be written to disk.
 		"""
 		if always_write_to_disk:
-			rootfolder = os.path.join(dataFolderPath, project_name)
-			self.write_json_to_file(os.path.join(rootfolder, "events", str(event["id"]) + ".json"), event)
+			self.write_record_to_file(project_name, "events", event["id"], event)
 
 	def write_project_comment_to_disk(self, project_name, comment):
 		"""
@@ -132,8 +281,7 @@ class DBManager(FileManager):
 		:param comment: the comment to be written to disk.
 		"""
 		if always_write_to_disk:
-			rootfolder = os.path.join(dataFolderPath, project_name)
-			self.write_json_to_file(os.path.join(rootfolder, "comments", str(comment["id"]) + ".json"), comment)
+			self.write_record_to_file(project_name, "comments", comment["id"], comment)
 
 	def write_project_worklog_to_disk(self, project_name, worklog):
 		"""
@@ -143,6 +291,5 @@ class DBManager(FileManager):
 		:param worklog: the worklog to be written to disk.
 		"""
 		if always_write_to_disk:
-			rootfolder = os.path.join(dataFolderPath, project_name)
-			self.write_json_to_file(os.path.join(rootfolder, "worklogs", str(worklog["id"]) + ".json"), worklog)
+			self.write_record_to_file(project_name, "worklogs", worklog["id"], worklog)
 
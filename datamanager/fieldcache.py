@@ -0,0 +1,100 @@
+import os
+import time
+import hashlib
+import threading
+from datamanager.filemanager import FileManager
+from downloader.jsondecoder import decode_json
+from helpers import compute_issue_fields
+
+class FieldCache(FileManager):
+	"""
+	Class that implements a cache for the fields of a Jira instance, as returned by get_issue_fields.
+	The fields are shared by all the projects of a run, and they are persisted to disk, so that they
+	are downloaded again only after the cache expires. When the fields are downloaded again, the
+	custom fields keep the keys that they were given before, so that the documents of incremental
+	crawls are always written under the same keys. The cached fields belong to the Jira instance from
+	which they were downloaded, so they are downloaded anew (without keeping any keys) when the fields
+	of another Jira instance are requested.
+	"""
+	def __init__(self, filename, ttl_in_seconds, revalidate = True):
+		"""
+		Initializes this field cache.
+
+		:param filename: the path to the file where the cache is persisted, or None to keep it only in memory.
+		:param ttl_in_seconds: the time after which the cached fields expire.
+		:param revalidate: set to True to revalidate the expired fields with a conditional request, so that
+		                   unchanged fields are not downloaded (if the server supports ETags).
+		"""
+		self.filename = filename
+		self.ttl_in_seconds = ttl_in_seconds
+		self.revalidate = revalidate
+		self.entry = None
+		self.lock = threading.Lock()
+
+	def get_issue_fields(self, jdownloader, custom_fields_api_address):
+		"""
+		Returns the fields of the Jira instance from the cache, downloading them if the cache has expired.
+
+		:param jdownloader: an instance of JiraDownloader.
+		:param custom_fields_api_address: the address from where the fields are downloaded.
+		:returns: a dictionary containing the old field keys as keys and the new field keys as values
+		          and a dictionary containing the old field keys as keys and the types as values.
+		"""
+		with self.lock:
+			if self.entry == None and self.filename != None:
+				self.entry = self.read_json_from_file_if_it_exists(self.filename) or None
+			if self.entry != None and self.entry.get("address") != custom_fields_api_address:
+				# The cached fields are of another Jira instance
+				self.entry = None
+			if self.entry == None or time.time() - self.entry["downloaded"] >= self.ttl_in_seconds:
+				self.update(jdownloader, custom_fields_api_address)
+			return self.entry["fieldids"], self.entry["fieldtypes"]
+
+	def read_issue_fields(self, custom_fields_api_address):
+		"""
+		Returns the fields of the Jira instance from the cache without downloading them, regardless of
+		whether the cache has expired (e.g. for processing again data that were downloaded before).
+
+		:param custom_fields_api_address: the address from where the fields were downloaded.
+		:returns: the fields as returned by get_issue_fields, or None if the cache is empty or it contains the fields of another Jira instance.
+		"""
+		with self.lock:
+			if self.entry == None and self.filename != None:
+				self.entry = self.read_json_from_file_if_it_exists(self.filename) or None
+			if self.entry == None or self.entry.get("address") != custom_fields_api_address:
+				return None
+			return self.entry["fieldids"], self.entry["fieldtypes"]
+
+	def update(self, jdownloader, custom_fields_api_address):
+		"""
+		Downloads the fields of the Jira instance and updates the cache.
+
+		:param jdownloader: an instance of JiraDownloader.
+		:param custom_fields_api_address: the address from where the fields are downloaded.
+		"""
+		headers = None
+		if self.revalidate and self.entry != None and self.entry.get("etag"):
+			headers = "If-None-Match: " + self.entry["etag"]
+		r = jdownloader.download_request(custom_fields_api_address, None, headers)
+		if r.status_code == 304:
+			self.entry["downloaded"] = time.time()
+		else:
+			r.raise_for_status()
+			digest = hashlib.sha1(r.content).hexdigest()
+			if self.entry == None or self.entry.get("digest") != digest:
+				previous_fieldids = self.entry["fieldids"] if self.entry != None else None
+				fieldids, fieldtypes = compute_issue_fields(decode_json(r.content), previous_fieldids)
+				self.entry = {"address": custom_fields_api_address, "fieldids": fieldids, "fieldtypes": fieldtypes, "digest": digest}
+			self.entry["etag"] = r.headers.get("ETag")
+			self.entry["downloaded"] = time.time()
+		self.write()
+
+	def write(self):
+		"""
+		Persists the cache to disk. The file is replaced atomically, so that processes that share it
+		never read a partially written file.
+		"""
+		if self.filename != None:
+			temporary_filename = self.filename + "." + str(os.getpid()) + ".tmp"
+			self.write_json_to_file(temporary_filename, self.entry)
+			os.replace(temporary_filename, self.filename)
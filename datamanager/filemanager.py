@@ -1,6 +1,7 @@
 import os
 import json
 import codecs
+from concurrent.futures import ThreadPoolExecutor
 
 class FileManager:
 	"""
@@ -26,21 +27,36 @@ class FileManager:
 		"""
 		return self.read_json_from_file(filename) if os.path.exists(filename) else {}
 
-	def read_jsons_from_folder(self, foldername, element_id):
+	def read_jsons_from_folder(self, foldername, element_id, num_workers = 1, chunk_size = 1000):
 		"""
 		Reads the files of a folder into a dict of JSON objects. Given that a file
 		has a JSON object e.g. element, the returned dict has as key the element_id
 		field of the element (element[element_id]) and as value the element itself.
+		If num_workers is larger than 1, then the files are read in chunks in parallel.
 
 		:param foldername: the path to the folder from where JSON objects are read.
 		:param element_id: the JSON key to be used as a key to the returned dict.
+		:param num_workers: the number of threads that read the files.
+		:param chunk_size: the number of files that are read by a thread at once.
 		:returns: a dict containing the JSON objects that are contained in the folder.
 		"""
-		data = {}
-		for filename in os.listdir(foldername):
-			element = self.read_json_from_file(os.path.join(foldername, filename))
-			data[element[element_id]] = element
-		return data
+		filenames = [os.path.join(foldername, filename) for filename in os.listdir(foldername)]
+		if num_workers <= 1 or len(filenames) <= chunk_size:
+			elements = [self.read_json_from_file(filename) for filename in filenames]
+		else:
+			chunks = [filenames[i:i + chunk_size] for i in range(0, len(filenames), chunk_size)]
+			with ThreadPoolExecutor(max_workers = num_workers) as executor:
+				elements = [element for chunk in executor.map(self.read_jsons_from_files, chunks) for element in chunk]
+		return {element[element_id]: element for element in elements}
+
+	def read_jsons_from_files(self, filenames):
+		"""
+		Reads a list of files into JSON objects.
+
+		:param filenames: the filenames of the files to be read.
+		:returns: a list containing the JSON objects of the files.
+		"""
+		return [self.read_json_from_file(filename) for filename in filenames]
 
 	def read_json_from_file(self, filename):
 		"""
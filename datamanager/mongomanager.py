@@ -1,11 +1,23 @@
+import bson
+import time
+import gridfs
 import pymongo
-from datamanager.project import Project
+import threading
+from pymongo import UpdateOne
+from datamanager.project import Project, LazyProject
 from datamanager.filemanager import FileManager
+from datamanager.bulkwriter import BulkWriter
+from logger.metrics import metrics
 from datamanager.databasemanager import DatabaseManager
-from properties import always_write_to_disk, database_host_and_port
+from properties import always_write_to_disk, database_host_and_port, max_document_size_in_KB
 from bson import json_util
 from pymongo.errors import DocumentTooLarge
-from helpers import get_size_of_json_object_in_KB
+
+# The keys of the users that are written in this run, and the (project name, user key) pairs that are
+# written in this run, shared by all the managers of the process
+written_users = set()
+written_project_users = set()
+written_users_lock = threading.Lock()
 
 class MongoDBManager(DatabaseManager, FileManager):
 	"""
@@ -13,10 +25,13 @@ class MongoDBManager(DatabaseManager, FileManager):
 	initialize_write_to_disk, then optionally call any other method for writing data to
 	disk, and finally call the method finalize_write_to_disk.
 	"""
-	def __init__(self):
+	def __init__(self, database_name = "jidata"):
 		"""
 		Initializes this DB manager.
+
+		:param database_name: the name of the database where the data are written.
 		"""
+		self.database_name = database_name
 		self._create_new_connection()
 
 	def _create_new_connection(self):
@@ -24,13 +39,16 @@ class MongoDBManager(DatabaseManager, FileManager):
 		Creates a new client connection.
 		"""
 		self.client = pymongo.MongoClient(database_host_and_port)
-		self.db = self.client["jidata"]
+		self.db = self.client[self.database_name]
 		self.projects = self.db["projects"]
 		self.issues = self.db["issues"]
 		self.users = self.db["users"]
 		self.events = self.db["events"]
 		self.comments = self.db["comments"]
 		self.worklogs = self.db["worklogs"]
+		self.cursors = self.db["cursors"]
+		self.oversized = gridfs.GridFS(self.db, collection = "oversized")
+		self.bulk_writer = BulkWriter()
 
 	def initialize_write_to_disk(self, project_name):
 		"""
@@ -40,13 +58,20 @@ class MongoDBManager(DatabaseManager, FileManager):
 		"""
 		pass
 
-	def read_project_from_disk(self, project_name):
+	def read_project_from_disk(self, project_name, lazy = True):
 		"""
-		Reads a project from disk given the name of the project.
+		Reads a project from disk given the name of the project. By default, the project is read lazily,
+		that is only its info and the keys of its users are loaded, and the update datetime of its last
+		updated issue is computed by the database.
 
 		:param project_name: the name of the project to be read from disk.
-		:returns: an object of type Project.
+		:param lazy: set to False to load all the issues, users, events, comments, and worklogs of the project.
+		:returns: an object of type Project (or LazyProject if lazy is True).
 		"""
+		if lazy:
+			project = LazyProject(self.read_project_last_updated(project_name), (obj["_id"] for obj in self.users.find({"projectname": project_name}, {"_id": 1})))
+			project["info"] = self.projects.find_one({"projectname": project_name})
+			return project
 		project = Project()
 		project["info"] = self.projects.find_one({"projectname": project_name})
 		project["issues"] = {obj["_id"]: obj for obj in self.issues.find({"projectname": project_name})}
@@ -56,6 +81,17 @@ class MongoDBManager(DatabaseManager, FileManager):
 		project["worklogs"] = {obj["_id"]: obj for obj in self.worklogs.find({"projectname": project_name})}
 		return project
 
+	def read_project_last_updated(self, project_name):
+		"""
+		Returns the update datetime of the last updated issue of a project, computed by the database.
+
+		:param project_name: the name of the project.
+		:returns: the update datetime of the last updated issue, or None if the project has no issues.
+		"""
+		result = list(self.issues.aggregate([{"$match": {"projectname": project_name}},
+											 {"$group": {"_id": None, "updated": {"$max": "$updated"}}}]))
+		return result[0]["updated"] if len(result) > 0 else None
+
 	def project_exists(self, project_name):
 		"""
 		Check if a project exists in the disk given the name of the project. The
@@ -68,7 +104,9 @@ class MongoDBManager(DatabaseManager, FileManager):
 
 	def finalize_write_to_disk(self, project_name, project, crawldatetime, lastcrawlcomplete):
 		"""
-		Finalizes the writing of a project to disk. Closes any open buffers.
+		Finalizes the writing of a project to disk. Sends any buffered operations to the database
+		before the status of the crawl is written, and then renews the connection. If the crawl is
+		complete, then the cursor of the crawl is removed.
 
 		:param project_name: the name of the project to be written to disk.
 		:param project: the project data to be written to disk.
@@ -82,35 +120,65 @@ class MongoDBManager(DatabaseManager, FileManager):
 			for issue in project["issues"].values():
 				issue["_id"] = issue["id"]
 				issue["projectname"] = project_name
-			self.update_multiple(self.issues, project["issues"].values(), upsert = True)
+				self.update_document_buffered(self.issues, issue)
 			for user in project["users"].values():
-				user["_id"] = user["key"]
-				user["projectname"] = [project_name]
-				user_from_db = self.users.find_one({"_id": user["_id"]})
-				if user_from_db != None:
-					user["projectname"] += user_from_db["projectname"]
-			self.update_multiple(self.users, project["users"].values(), upsert = True)
+				self.update_user_buffered(project_name, user)
 			for event in project["events"].values():
 				event["_id"] = event["id"]
 				event["projectname"] = project_name
-			self.update_multiple(self.events, project["events"].values(), upsert = True)
+				self.update_document_buffered(self.events, event)
 			for comment in project["comments"].values():
 				comment["_id"] = comment["id"]
 				comment["projectname"] = project_name
-			for c in list(project["comments"].keys()):
-				if get_size_of_json_object_in_KB(project["comments"][c]) < 15000:
-					del project["comments"][c]
-			self.update_multiple(self.comments, project["comments"].values(), upsert = True)
+				self.update_document_buffered(self.comments, comment)
 			for worklog in project["worklogs"].values():
 				worklog["_id"] = worklog["id"]
 				worklog["projectname"] = project_name
-			self.update_multiple(self.worklogs, project["worklogs"].values(), upsert = True)
+				self.update_document_buffered(self.worklogs, worklog)
+		self.bulk_writer.flush()
 		project["info"]["lastcrawlcomplete"] = lastcrawlcomplete
 		project["info"]["lastcrawled"] = crawldatetime
 		self.projects.update_one({"_id": project["info"]["_id"]}, {"$set": project["info"]}, upsert = True)
+		if lastcrawlcomplete:
+			self.cursors.delete_one({"_id": project_name})
 		self.client.close()
 		self._create_new_connection()
 
+	def read_project_issues_updated(self, project_name, issue_ids = None):
+		"""
+		Reads the update datetimes of the stored issues of a project, using a single query.
+
+		:param project_name: the name of the project.
+		:param issue_ids: the ids of the issues, default is all the stored issues of the project.
+		:returns: a dict containing the ids of the stored issues as keys and their update datetimes as values.
+		"""
+		query = {"projectname": project_name} if issue_ids == None else {"_id": {"$in": list(issue_ids)}}
+		return {obj["_id"]: obj.get("updated") for obj in self.issues.find(query, {"updated": 1})}
+
+	def read_project_cursor(self, project_name):
+		"""
+		Reads the cursor of the last crawl of a project, if the crawl was interrupted.
+
+		:param project_name: the name of the project.
+		:returns: the cursor as a dict, or None if there is no cursor.
+		"""
+		return self.cursors.find_one({"_id": project_name}, {"_id": 0})
+
+	def write_project_cursor_to_disk(self, project_name, cursor):
+		"""
+		Writes the cursor of the crawl of a project to the database, after sending any buffered
+		operations, so that an interrupted crawl can be resumed from the cursor.
+
+		:param project_name: the name of the project.
+		:param cursor: the cursor to be written to the database.
+		"""
+		if always_write_to_disk:
+			self.bulk_writer.flush()
+			start = time.monotonic()
+			self.cursors.replace_one({"_id": project_name}, cursor, upsert = True)
+			metrics.increment("jidownloader_documents_written_total", collection = "cursors")
+			metrics.observe("jidownloader_write_duration_seconds", time.monotonic() - start, collection = "cursors")
+
 	def write_project_info_to_disk(self, project_name, info):
 		"""
 		Writes the info of a project to disk.
@@ -133,7 +201,7 @@ class MongoDBManager(DatabaseManager, FileManager):
 		if always_write_to_disk:
 			issue["_id"] = issue["id"]
 			issue["projectname"] = project_name
-			self.issues.update_one({"_id": issue["_id"]}, {"$set": issue}, upsert = True)
+			self.update_document_buffered(self.issues, issue)
 
 	def write_project_user_to_disk(self, project_name, user):
 		"""
@@ -143,12 +211,62 @@ class MongoDBManager(DatabaseManager, FileManager):
 		:param user: the user to be written to disk.
 		"""
 		if always_write_to_disk:
-			user["_id"] = user["key"]
-			user["projectname"] = [project_name]
-			user_from_db = self.users.find_one({"_id": user["_id"]})
-			if user_from_db != None:
-				user["projectname"] += user_from_db["projectname"]
-			self.users.update_one({"_id": user["_id"]}, {"$set": user}, upsert = True)
+			self.update_user_buffered(project_name, user)
+
+	def update_document_buffered(self, collection, document):
+		"""
+		Upserts a document through the bulk writer. Documents that exceed max_document_size_in_KB when
+		encoded in BSON are stored in the GridFS collection "oversized" instead (with the name of their
+		collection and their _id as file id), and a placeholder is upserted in their collection, having
+		their identifying fields and the field "oversized" set to True.
+
+		:param collection: the collection in which the document is upserted.
+		:param document: the document to be upserted.
+		"""
+		data = bson.encode(document)
+		if len(data) >= max_document_size_in_KB * 1024:
+			file_id = collection.name + ":" + str(document["_id"])
+			self.oversized.delete(file_id)
+			self.oversized.put(data, _id = file_id, collection = collection.name, projectname = document.get("projectname"))
+			document = {key: document[key] for key in ("_id", "id", "key", "issue", "projectname", "created", "updated") if key in document}
+			document["oversized"] = True
+		self.update_one_buffered(collection, document, upsert = True)
+
+	def read_oversized_document(self, collection, document_id):
+		"""
+		Reads a document that is stored in the GridFS collection "oversized" because of its size.
+
+		:param collection: the collection of the document.
+		:param document_id: the _id of the document.
+		:returns: the document, or None if the document is not oversized.
+		"""
+		file_id = collection.name + ":" + str(document_id)
+		return bson.decode(self.oversized.get(file_id).read()) if self.oversized.exists(file_id) else None
+
+	def update_user_buffered(self, project_name, user):
+		"""
+		Upserts a user through the bulk writer, adding the project to the projects of the user. The
+		user document is written only the first time the user is met in this run, while for any other
+		project only the project name is added (and the user document is set only if it is inserted,
+		in case the bulk that wrote it failed), and a user that is already written for the project is
+		skipped.
+
+		:param project_name: the name of the project.
+		:param user: the user to be written.
+		"""
+		with written_users_lock:
+			if (project_name, user["key"]) in written_project_users:
+				return
+			written_project_users.add((project_name, user["key"]))
+			user_written = user["key"] in written_users
+			written_users.add(user["key"])
+		user["_id"] = user["key"]
+		update = {"$addToSet": {"projectname": project_name}}
+		if not user_written:
+			update["$set"] = {key: value for key, value in user.items() if key != "projectname"}
+		else:
+			update["$setOnInsert"] = {key: value for key, value in user.items() if key not in ("_id", "projectname")}
+		self.bulk_writer.add(self.users, UpdateOne({"_id": user["_id"]}, update, upsert = True))
 
 	def write_project_event_to_disk(self, project_name, event):
 		"""
@@ -160,7 +278,7 @@ class MongoDBManager(DatabaseManager, FileManager):
 		if always_write_to_disk:
 			event["_id"] = event["id"]
 			event["projectname"] = project_name
-			self.events.update_one({"_id": event["_id"]}, {"$set": event}, upsert = True)
+			self.update_document_buffered(self.events, event)
 
 	def write_project_comment_to_disk(self, project_name, comment):
 		"""
@@ -172,8 +290,7 @@ class MongoDBManager(DatabaseManager, FileManager):
 		if always_write_to_disk:
 			comment["_id"] = comment["id"]
 			comment["projectname"] = project_name
-			if get_size_of_json_object_in_KB(comment) < 15000:
-				self.comments.update_one({"_id": comment["_id"]}, {"$set": comment}, upsert = True)
+			self.update_document_buffered(self.comments, comment)
 
 	def write_project_worklog_to_disk(self, project_name, worklog):
 		"""
@@ -185,4 +302,4 @@ class MongoDBManager(DatabaseManager, FileManager):
 		if always_write_to_disk:
 			worklog["_id"] = worklog["id"]
 			worklog["projectname"] = project_name
-			self.worklogs.update_one({"_id": worklog["_id"]}, {"$set": worklog}, upsert = True)
+			self.update_document_buffered(self.worklogs, worklog)
@@ -0,0 +1,162 @@
+import os
+import json
+import zlib
+import threading
+
+class PageArchive:
+	"""
+	Class that implements an append-only archive of the raw responses of the Jira API that are downloaded
+	by the crawls of each project (the info of the project, the pages of its issues, and the changelogs of
+	its issues). The responses of each crawl are appended to one file per kind of response (e.g. the file
+	MYPROJECT/20240101T120000.search.gz includes the pages of issues of the crawl that started at the given
+	time), each response being compressed as a separate gzip member, so that the files remain valid gzip
+	files. A partially written response at the end of a file (e.g. after a crash) is ignored when read,
+	and it is removed before anything else is appended to the file (e.g. by the resumed crawl, which
+	keeps the start time of the interrupted one).
+	"""
+	def __init__(self, foldername, compression_level = 6):
+		"""
+		Initializes this archive.
+
+		:param foldername: the path to the folder of the archive.
+		:param compression_level: the zlib compression level of the responses (from 1 for fastest to 9 for smallest).
+		"""
+		self.foldername = foldername
+		self.compression_level = compression_level
+		self.lock = threading.Lock()
+		# The files that this archive has appended to, which are known to end with a complete response
+		self.checked_filenames = set()
+
+	def crawl_filename(self, project_name, crawl, kind):
+		"""
+		Returns the path to the file of a kind of responses of a crawl.
+
+		:param project_name: the name of the project.
+		:param crawl: the start time of the crawl, as a datetime object or as a string in the format %Y%m%dT%H%M%S.
+		:param kind: the kind of the responses (e.g. search).
+		:returns: the path to the file.
+		"""
+		if not isinstance(crawl, str):
+			crawl = crawl.strftime("%Y%m%dT%H%M%S")
+		return os.path.join(self.foldername, project_name, crawl + "." + kind + ".gz")
+
+	def append(self, project_name, crawl, kind, body, header = None):
+		"""
+		Appends a response to the archive.
+
+		:param project_name: the name of the project.
+		:param crawl: the start time of the crawl.
+		:param kind: the kind of the response (e.g. search).
+		:param body: the body of the response.
+		:param header: a dict that is stored along with the response (e.g. the key of an issue), default is an empty dict.
+		"""
+		compressor = zlib.compressobj(self.compression_level, wbits = 31)
+		data = compressor.compress((json.dumps(header or {}) + "\n").encode("utf-8")) + compressor.compress(body) + compressor.flush()
+		filename = self.crawl_filename(project_name, crawl, kind)
+		with self.lock:
+			if not os.path.exists(os.path.dirname(filename)):
+				os.makedirs(os.path.dirname(filename))
+			if filename not in self.checked_filenames:
+				if os.path.exists(filename):
+					# Remove any partially written response of an interrupted crawl, so that the appended responses can be read
+					end = max((end for _, end, _ in self.read_members(filename)), default = 0)
+					if end < os.path.getsize(filename):
+						with open(filename, 'r+b') as outfile:
+							outfile.truncate(end)
+				self.checked_filenames.add(filename)
+			with open(filename, 'ab') as outfile:
+				outfile.write(data)
+
+	def projects(self):
+		"""
+		Returns the projects of the archive, starting from the ones with the largest archives.
+
+		:returns: a list containing the names of the projects.
+		"""
+		if not os.path.exists(self.foldername):
+			return []
+		project_names = [name for name in os.listdir(self.foldername) if os.path.isdir(os.path.join(self.foldername, name))]
+		return sorted(project_names, key = lambda project_name: -self.size(project_name))
+
+	def size(self, project_name):
+		"""
+		Returns the size of the archive of a project.
+
+		:param project_name: the name of the project.
+		:returns: the size of the files of the project in bytes.
+		"""
+		foldername = os.path.join(self.foldername, project_name)
+		return sum(os.path.getsize(os.path.join(foldername, filename)) for filename in os.listdir(foldername))
+
+	def crawls(self, project_name):
+		"""
+		Returns the crawls of a project that are included in the archive, in chronological order.
+
+		:param project_name: the name of the project.
+		:returns: a list containing the start times of the crawls as strings in the format %Y%m%dT%H%M%S.
+		"""
+		foldername = os.path.join(self.foldername, project_name)
+		if not os.path.exists(foldername):
+			return []
+		return sorted(set(filename.split(".")[0] for filename in os.listdir(foldername) if filename.endswith(".gz")))
+
+	def contains(self, project_name, crawl, kind):
+		"""
+		Checks whether the archive includes any response of a kind for a crawl.
+
+		:param project_name: the name of the project.
+		:param crawl: the start time of the crawl.
+		:param kind: the kind of the responses (e.g. search).
+		:returns: True if the archive includes such responses, or False otherwise.
+		"""
+		return os.path.exists(self.crawl_filename(project_name, crawl, kind))
+
+	def read(self, project_name, crawl, kind, chunk_size = 1024 * 1024):
+		"""
+		Reads the responses of a kind of a crawl, in the order they were appended.
+
+		:param project_name: the name of the project.
+		:param crawl: the start time of the crawl.
+		:param kind: the kind of the responses (e.g. search).
+		:param chunk_size: the number of bytes that are read from the file at once.
+		:returns: a generator of tuples containing the header and the body of each response.
+		"""
+		filename = self.crawl_filename(project_name, crawl, kind)
+		if not os.path.exists(filename):
+			return
+		for _, _, member in self.read_members(filename, chunk_size):
+			end = member.find(b"\n")
+			yield json.loads(member[:end]), member[end + 1:]
+
+	def read_members(self, filename, chunk_size = 1024 * 1024):
+		"""
+		Reads the gzip members of a file, ignoring a partially written member at the end of the file.
+
+		:param filename: the path to the file.
+		:param chunk_size: the number of bytes that are read from the file at once.
+		:returns: a generator of tuples containing the start offset, the end offset, and the decompressed data of each member.
+		:raises ValueError: if a member is corrupt, e.g. when a partially written member is followed by other members.
+		"""
+		with open(filename, 'rb') as infile:
+			decompressor = zlib.decompressobj(wbits = 31)
+			parts = []
+			start = consumed = 0
+			data = infile.read(chunk_size)
+			while data:
+				try:
+					parts.append(decompressor.decompress(data))
+				except zlib.error as e:
+					raise ValueError("Corrupt response at offset " + str(start) + " of " + filename + ": " + str(e))
+				consumed += len(data)
+				if decompressor.eof:
+					# A member ends here, so the rest of the data belongs to the next member
+					end = consumed - len(decompressor.unused_data)
+					yield start, end, b"".join(parts)
+					data = decompressor.unused_data
+					consumed = start = end
+					decompressor = zlib.decompressobj(wbits = 31)
+					parts = []
+				else:
+					data = b""
+				if not data:
+					data = infile.read(chunk_size)
@@ -130,3 +130,38 @@ class Project(dict):
 		:returns: the update datetime of the last updated issue as a datetime object.
 		"""
 		return max(datetime.strptime(str(issue["updated"]), "%Y-%m-%d %H:%M:%S") for issue in self["issues"].values()) if len(self["issues"]) > 0 else None
+
+class LazyProject(Project):
+	"""
+	Class that includes the data of a Jira project that is already stored, without loading all of its
+	stored data. It contains the info and the keys of the stored users of the project (so that existing
+	users are not written again), and the update datetime of the last updated stored issue, while its
+	issues, users, events, comments, and worklogs include only the ones that are added to it.
+	"""
+	def __init__(self, stored_last_updated = None, stored_user_keys = ()):
+		"""
+		Initializes this project.
+
+		:param stored_last_updated: the update datetime of the last updated issue that is already stored.
+		:param stored_user_keys: the keys of the users of the project that are already stored.
+		"""
+		super().__init__(info = {}, issues = {}, users = {}, events = {}, comments = {}, worklogs = {})
+		self.stored_last_updated = stored_last_updated
+		self.stored_user_keys = set(stored_user_keys)
+
+	def user_exists(self, user):
+		"""
+		Checks if the given user exists in the project, either stored or added to it.
+
+		:param user: the user to be checked.
+		:returns: True if the given user exists in the project, or False otherwise.
+		"""
+		return user["key"] in self.stored_user_keys or user["key"] in self["users"]
+
+	def last_updated(self):
+		"""
+		Returns the update datetime of the last updated stored issue.
+
+		:returns: the update datetime of the last updated stored issue as a datetime object.
+		"""
+		return self.stored_last_updated
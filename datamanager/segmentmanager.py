@@ -0,0 +1,240 @@
+import os
+import time
+import threading
+from datetime import datetime
+from datamanager.project import Project, LazyProject
+from datamanager.filemanager import FileManager
+from datamanager.segmentstore import SegmentStore
+from logger.metrics import metrics
+from properties import dataFolderPath, always_write_to_disk, segment_compression, segment_size_in_MB
+from properties import segment_compaction_ratio, segment_compaction_interval_in_seconds
+
+class SegmentDBManager(FileManager):
+	"""
+	Class that implements a DB manager that stores the data of each project in append-only segment
+	files (see class SegmentStore), one store per entity (issues, users, events, comments, worklogs).
+	The segments are compacted in a background thread. To use this class, you must first call the
+	method initialize_write_to_disk, then optionally call any other method for writing data to disk,
+	and finally call the method finalize_write_to_disk.
+	"""
+	entities = {"issues": "id", "users": "key", "events": "id", "comments": "id", "worklogs": "id"}
+
+	def __init__(self):
+		"""
+		Initializes this DB manager and starts its compaction thread.
+		"""
+		self.create_folder_if_it_does_not_exist(dataFolderPath)
+		self.stores = {}
+		self.lock = threading.Lock()
+		self.compactor = threading.Thread(target = self.compact_periodically, daemon = True)
+		self.compactor.start()
+
+	def get_store(self, project_name, entity):
+		"""
+		Returns the store of an entity of a project, opening it if it is not already open.
+
+		:param project_name: the name of the project.
+		:param entity: the name of the entity (e.g. issues).
+		:returns: the store as an object of type SegmentStore.
+		"""
+		with self.lock:
+			if (project_name, entity) not in self.stores:
+				self.stores[(project_name, entity)] = SegmentStore(os.path.join(dataFolderPath, project_name, entity), self.entities[entity],
+																   segment_compression, segment_size_in_MB * 1024 * 1024)
+			return self.stores[(project_name, entity)]
+
+	def compact_periodically(self):
+		"""
+		Compacts the open stores every segment_compaction_interval_in_seconds seconds.
+		"""
+		while True:
+			time.sleep(segment_compaction_interval_in_seconds)
+			with self.lock:
+				stores = list(self.stores.values())
+			for store in stores:
+				store.compact(segment_compaction_ratio)
+
+	def initialize_write_to_disk(self, project_name):
+		"""
+		Initializes the writing of a project to disk. Creates all the necessary directories and opens the stores.
+
+		:param project_name: the name of the project to be written to disk.
+		"""
+		self.create_folder_if_it_does_not_exist(os.path.join(dataFolderPath, project_name))
+		for entity in self.entities:
+			self.get_store(project_name, entity)
+
+	def read_project_from_disk(self, project_name, lazy = True):
+		"""
+		Reads a project from disk given the name of the project. By default, the project is read lazily
+		from the indexes of the stores, that is only its info, the keys of its users, and the update
+		datetime of its last updated issue are loaded. Otherwise, all the records of the project are read
+		from the segments of the stores.
+
+		:param project_name: the name of the project to be read from disk.
+		:param lazy: set to False to read all the records of the project.
+		:returns: an object of type LazyProject, or an object of type Project if lazy is False.
+		"""
+		if lazy:
+			issues_updated = [updated for updated in self.get_store(project_name, "issues").updated().values() if updated != None]
+			project = LazyProject(datetime.fromisoformat(max(issues_updated)) if len(issues_updated) > 0 else None, self.get_store(project_name, "users").ids())
+			project["info"] = self.read_json_from_file_if_it_exists(os.path.join(dataFolderPath, project_name, "info.json"))
+			return project
+		project = Project()
+		project["info"] = self.read_json_from_file_if_it_exists(os.path.join(dataFolderPath, project_name, "info.json"))
+		for entity in self.entities:
+			project[entity] = dict(self.get_store(project_name, entity).items())
+		return project
+
+	def project_exists(self, project_name):
+		"""
+		Check if a project exists in the disk given the name of the project that is also the folder
+		of the project. The existence of the project is determined by whether it has an info.json file.
+
+		:param project_name: the name of the project to be read from disk.
+		:returns: True if the project exists, or False otherwise.
+		"""
+		return os.path.exists(os.path.join(dataFolderPath, project_name, "info.json"))
+
+	def finalize_write_to_disk(self, project_name, project, crawldatetime, lastcrawlcomplete):
+		"""
+		Finalizes the writing of a project to disk. Makes the written records durable and closes the stores.
+		If the crawl is complete, then the cursor of the crawl is removed.
+
+		:param project_name: the name of the project to be written to disk.
+		:param project: the project data to be written to disk.
+		:param crawldatetime: the time that this crawl started.
+		:param lastcrawlcomplete: the status of the last crawl, either True for complete of False otherwise.
+		"""
+		if not always_write_to_disk:
+			for entity in self.entities:
+				store = self.get_store(project_name, entity)
+				for record in project[entity].values():
+					store.put(record)
+		for entity in self.entities:
+			with self.lock:
+				store = self.stores.pop((project_name, entity), None)
+			if store != None:
+				store.close()
+		project["info"]["lastcrawlcomplete"] = lastcrawlcomplete
+		project["info"]["lastcrawled"] = crawldatetime
+		self.write_json_to_file(os.path.join(dataFolderPath, project_name, "info.json"), project["info"])
+		if lastcrawlcomplete and os.path.exists(os.path.join(dataFolderPath, project_name, "cursor.json")):
+			os.remove(os.path.join(dataFolderPath, project_name, "cursor.json"))
+
+	def read_project_issues_updated(self, project_name, issue_ids = None):
+		"""
+		Reads the update datetimes of the stored issues of a project, as they are kept in the index of its store.
+
+		:param project_name: the name of the project.
+		:param issue_ids: the ids of the issues, default is all the stored issues of the project.
+		:returns: a dict containing the ids of the stored issues as keys and their update datetimes as values.
+		"""
+		return self.get_store(project_name, "issues").updated(issue_ids)
+
+	def read_project_cursor(self, project_name):
+		"""
+		Reads the cursor of the last crawl of a project, if the crawl was interrupted.
+
+		:param project_name: the name of the project.
+		:returns: the cursor as a dict, or None if there is no cursor.
+		"""
+		return self.read_json_from_file_if_it_exists(os.path.join(dataFolderPath, project_name, "cursor.json")) or None
+
+	def write_project_cursor_to_disk(self, project_name, cursor):
+		"""
+		Writes the cursor of the crawl of a project to disk, after making the records that are
+		written before it durable, so that an interrupted crawl can be resumed from the cursor.
+
+		:param project_name: the name of the project.
+		:param cursor: the cursor to be written to disk.
+		"""
+		if always_write_to_disk:
+			for entity in self.entities:
+				self.get_store(project_name, entity).flush()
+			self.write_json_to_file(os.path.join(dataFolderPath, project_name, "cursor.json"), cursor)
+
+	def write_project_info_to_disk(self, project_name, info):
+		"""
+		Writes the info of a project to disk.
+
+		:param project_name: the name of the project.
+		:param info: the info to be written to disk.
+		"""
+		if always_write_to_disk:
+			self.write_json_to_file(os.path.join(dataFolderPath, project_name, "info.json"), info)
+
+	def put_record(self, project_name, entity, record):
+		"""
+		Appends a record of a project to the store of its entity. The written record and the time of
+		writing it are recorded in the metrics.
+
+		:param project_name: the name of the project.
+		:param entity: the name of the entity of the record (e.g. issues).
+		:param record: the record to be written.
+		"""
+		start = time.monotonic()
+		self.get_store(project_name, entity).put(record)
+		metrics.increment("jidownloader_documents_written_total", collection = entity)
+		metrics.observe("jidownloader_write_duration_seconds", time.monotonic() - start, collection = entity)
+
+	def write_project_issue_to_disk(self, project_name, issue):
+		"""
+		Writes an issue of a project to disk.
+
+		:param project_name: the name of the project.
+		:param issue: the issue to be written to disk.
+		"""
+		if always_write_to_disk:
+			self.put_record(project_name, "issues", issue)
+
+	def write_project_user_to_disk(self, project_name, user):
+		"""
+		Writes a user of a project to disk.
+
+		:param project_name: the name of the project.
+		:param user: the user to be written to disk.
+		"""
+		if always_write_to_disk:
+			self.put_record(project_name, "users", user)
+
+	def write_project_event_to_disk(self, project_name, event):
+		"""
+		Writes an event of a project to disk.
+
+		:param project_name: the name of the project.
+		:param event: the event to be written to disk.
+		"""
+		if always_write_to_disk:
+			self.put_record(project_name, "events", event)
+
+	def write_project_comment_to_disk(self, project_name, comment):
+		"""
+		Writes a comment of a project to disk.
+
+		:param project_name: the name of the project.
+		:param comment: the comment to be written to disk.
+		"""
+		if always_write_to_disk:
+			self.put_record(project_name, "comments", comment)
+
+	def write_project_worklog_to_disk(self, project_name, worklog):
+		"""
+		Writes a worklog of a project to disk.
+
+		:param project_name: the name of the project.
+		:param worklog: the worklog to be written to disk.
+		"""
+		if always_write_to_disk:
+			self.put_record(project_name, "worklogs", worklog)
+
+	def read_project_records(self, project_name, entity):
+		"""
+		Reads all the records of an entity of a project, e.g. all its issues.
+
+		:param project_name: the name of the project.
+		:param entity: the name of the entity (issues, users, events, comments, or worklogs).
+		:returns: a generator containing the records.
+		"""
+		for _, record in self.get_store(project_name, entity).items():
+			yield record
@@ -0,0 +1,412 @@
+import os
+import json
+import zlib
+import threading
+
+class SegmentStore:
+	"""
+	Class that implements an append-only store of JSON records, e.g. the issues of a project. The
+	records are appended as JSON lines to segment files (optionally with each line compressed as a
+	separate gzip member, so that the files remain valid gzip files). An index that maps the id of
+	each record to its segment, offset, and length is kept in memory and persisted in the file
+	index.json, so that lookups and updates do not scan the segments. The index is written only when
+	the store is closed or compacted, while the locations of the records that are appended in between
+	are appended to an index log at each flush, so that the cost of a flush does not grow with the
+	size of the store. An updated record is appended again and its old copy becomes garbage, which is
+	removed by compacting the segment.
+	"""
+	def __init__(self, foldername, element_id, compress = True, max_segment_size_in_bytes = 64 * 1024 * 1024):
+		"""
+		Initializes this store, reading its index or rebuilding it from the segments if it is outdated.
+
+		:param foldername: the path to the folder of the store.
+		:param element_id: the JSON key of the records that is used as their id.
+		:param compress: set to True to compress the records that are appended to the store.
+		:param max_segment_size_in_bytes: the size after which a new segment is started.
+		"""
+		self.foldername = foldername
+		self.element_id = element_id
+		self.compress = compress
+		self.max_segment_size_in_bytes = max_segment_size_in_bytes
+		self.lock = threading.RLock()
+		self.outfile = None
+		self.closed = False
+		# The locations of the records that are appended after the last flush, as entries of the index log
+		self.pending = []
+		if not os.path.exists(foldername):
+			os.makedirs(foldername)
+		self.read_index()
+
+	def segment_filename(self, segment):
+		"""
+		Returns the path to the file of a segment.
+
+		:param segment: the name of the segment.
+		:returns: the path to the file of the segment.
+		"""
+		return os.path.join(self.foldername, segment)
+
+	def log_filename(self):
+		"""
+		Returns the path to the index log of the current index of this store.
+
+		:returns: the path to the index log.
+		"""
+		return os.path.join(self.foldername, "index.%d.log" % self.generation)
+
+	def read_index(self):
+		"""
+		Reads the index of this store and applies its index log. The records that were appended after
+		the last flush (e.g. before a crash) are read from the ends of the segments. If the index is
+		missing or does not match the segments, then it is rebuilt by scanning the segments.
+		"""
+		segments = sorted(filename for filename in os.listdir(self.foldername) if filename.endswith((".jsonl", ".jsonl.gz")))
+		index_filename = os.path.join(self.foldername, "index.json")
+		if os.path.exists(index_filename):
+			with open(index_filename, 'r', encoding = 'utf-8') as infile:
+				index = json.load(infile)
+			self.records = index["records"]
+			self.sizes = index["sizes"]
+			self.garbage = index["garbage"]
+			self.generation = index.get("generation", 0)
+			self.read_index_log()
+			if self.read_segment_ends(segments):
+				return
+		self.generation = 0
+		self.records = {}
+		self.sizes = {}
+		self.garbage = {}
+		for segment in segments:
+			self.sizes[segment] = 0
+			self.garbage[segment] = 0
+			self.read_segment_end(segment)
+		self.pending = []
+		self.write_index()
+
+	def read_index_log(self):
+		"""
+		Applies the entries of the index log to the index, i.e. the locations of the records that were
+		appended after the index was written. A partially written entry at the end of the log is ignored.
+		"""
+		if not os.path.exists(self.log_filename()):
+			return
+		with open(self.log_filename(), 'r', encoding = 'utf-8') as infile:
+			for line in infile:
+				try:
+					record_id, segment, offset, length, updated = json.loads(line)
+				except ValueError:
+					break
+				self.sizes[segment] = max(self.sizes.get(segment, 0), offset + length)
+				self.garbage.setdefault(segment, 0)
+				self.set_location(record_id, [segment, offset, length, updated])
+
+	def read_segment_ends(self, segments):
+		"""
+		Adds to the index the records that were appended to the segments after the index and its log
+		were last written.
+
+		:param segments: the names of the segments in the folder of this store.
+		:returns: True if the index matches the segments, or False if it has to be rebuilt (e.g. if a segment is missing).
+		"""
+		if any(segment not in segments or os.path.getsize(self.segment_filename(segment)) < size for segment, size in self.sizes.items()):
+			return False
+		for segment in segments:
+			if segment not in self.sizes:
+				self.sizes[segment] = 0
+				self.garbage[segment] = 0
+			if os.path.getsize(self.segment_filename(segment)) > self.sizes[segment]:
+				self.read_segment_end(segment)
+		return True
+
+	def read_segment_end(self, segment):
+		"""
+		Adds to the index the records of a segment after its indexed size, dropping any partially
+		written record at the end of the segment.
+
+		:param segment: the name of the segment.
+		"""
+		for offset, length, record in self.scan_segment(segment, self.sizes[segment]):
+			self.add_to_index(record[self.element_id], segment, offset, length, record)
+			self.sizes[segment] = offset + length
+		if self.sizes[segment] < os.path.getsize(self.segment_filename(segment)):
+			with open(self.segment_filename(segment), 'r+b') as outfile:
+				outfile.truncate(self.sizes[segment])
+
+	def scan_segment(self, segment, offset = 0):
+		"""
+		Reads the records of a segment.
+
+		:param segment: the name of the segment.
+		:param offset: the offset of the first record that is read.
+		:returns: a generator of tuples containing the offset, the length, and the record of each record of the segment.
+		"""
+		with open(self.segment_filename(segment), 'rb') as infile:
+			data = infile.read()
+		view = memoryview(data)
+		while offset < len(data):
+			if segment.endswith(".gz"):
+				# Decompress a single gzip member, feeding it in growing chunks to find where it ends
+				decompressor = zlib.decompressobj(wbits = 31)
+				position, chunk_size, line = offset, 4096, b""
+				try:
+					while not decompressor.eof and position < len(data):
+						line += decompressor.decompress(view[position:position + chunk_size])
+						position += chunk_size
+						chunk_size *= 2
+				except zlib.error:
+					return
+				if not decompressor.eof:
+					return
+				length = min(position, len(data)) - offset - len(decompressor.unused_data)
+			else:
+				end = data.find(b"\n", offset)
+				if end < 0:
+					return
+				line = data[offset:end + 1]
+				length = len(line)
+			yield offset, length, json.loads(line)
+			offset += length
+
+	def add_to_index(self, record_id, segment, offset, length, record):
+		"""
+		Adds the location of a record to the index, marking any previous copy of the record as garbage.
+		The update datetime of the record, if any, is also kept in the index. The location is appended
+		to the index log at the next flush.
+
+		:param record_id: the id of the record.
+		:param segment: the name of the segment of the record.
+		:param offset: the offset of the record in the segment.
+		:param length: the length of the record in the segment.
+		:param record: the record.
+		"""
+		updated = record.get("updated")
+		if updated != None and not isinstance(updated, str):
+			updated = str(updated)[:-6]
+		self.set_location(str(record_id), [segment, offset, length, updated])
+		self.pending.append([str(record_id), segment, offset, length, updated])
+
+	def set_location(self, record_id, location):
+		"""
+		Sets the location of a record in the index, marking any previous copy of the record as garbage.
+
+		:param record_id: the id of the record as a string.
+		:param location: the location as a list containing the segment, the offset, the length, and the update datetime of the record.
+		"""
+		if record_id in self.records:
+			previous = self.records[record_id]
+			self.garbage[previous[0]] = self.garbage.get(previous[0], 0) + previous[2]
+		self.records[record_id] = location
+
+	def active_segment(self):
+		"""
+		Returns the segment where records are appended, starting a new segment if the last one is full.
+
+		:returns: the name of the segment.
+		"""
+		segments = sorted(self.sizes)
+		if len(segments) == 0 or self.sizes[segments[-1]] >= self.max_segment_size_in_bytes or segments[-1].endswith(".gz") != self.compress:
+			number = int(segments[-1].split(".")[0]) + 1 if len(segments) > 0 else 1
+			segment = "%08d.jsonl" % number + (".gz" if self.compress else "")
+			self.sizes[segment] = 0
+			self.garbage[segment] = 0
+			return segment
+		return segments[-1]
+
+	def append(self, data):
+		"""
+		Appends encoded data to the active segment.
+
+		:param data: the encoded record.
+		:returns: the segment and the offset where the data are appended.
+		"""
+		segment = self.active_segment()
+		if self.outfile == None or self.outfile.name != self.segment_filename(segment):
+			self.close_outfile()
+			self.outfile = open(self.segment_filename(segment), 'ab')
+		offset = self.sizes[segment]
+		self.outfile.write(data)
+		self.sizes[segment] += len(data)
+		return segment, offset
+
+	def put(self, record):
+		"""
+		Appends a record to this store, replacing any previous record with the same id.
+
+		:param record: the record to be stored.
+		"""
+		data = (json.dumps(record, sort_keys = True, ensure_ascii = False, default = lambda x: str(x)[:-6]) + "\n").encode("utf-8")
+		with self.lock:
+			if self.compress:
+				data = self.compress_data(data)
+			segment, offset = self.append(data)
+			self.add_to_index(record[self.element_id], segment, offset, len(data), record)
+
+	def read_record(self, location):
+		"""
+		Reads a record given its location.
+
+		:param location: the location of the record as a list containing its segment, its offset, and its length.
+		:returns: the record.
+		"""
+		segment, offset, length = location[:3]
+		if self.outfile != None and self.outfile.name == self.segment_filename(segment):
+			self.outfile.flush()
+		with open(self.segment_filename(segment), 'rb') as infile:
+			infile.seek(offset)
+			data = infile.read(length)
+		return json.loads(zlib.decompress(data, wbits = 31) if segment.endswith(".gz") else data)
+
+	def get(self, record_id):
+		"""
+		Returns a record given its id.
+
+		:param record_id: the id of the record.
+		:returns: the record, or None if the store does not contain it.
+		"""
+		with self.lock:
+			location = self.records.get(str(record_id))
+			return self.read_record(location) if location != None else None
+
+	def __contains__(self, record_id):
+		return str(record_id) in self.records
+
+	def __len__(self):
+		return len(self.records)
+
+	def ids(self):
+		"""
+		Returns the ids of the records of this store.
+
+		:returns: a list containing the ids of the records.
+		"""
+		with self.lock:
+			return list(self.records)
+
+	def updated(self, record_ids = None):
+		"""
+		Returns the update datetimes of the records of this store, as they are kept in the index.
+
+		:param record_ids: the ids of the records, default is all the records of this store.
+		:returns: a dict containing the ids of the records as keys and their update datetimes (or None) as values.
+		"""
+		with self.lock:
+			if record_ids != None:
+				return {record_id: self.records[str(record_id)][3] for record_id in record_ids if str(record_id) in self.records}
+			return {record_id: location[3] for record_id, location in self.records.items()}
+
+	def items(self):
+		"""
+		Reads all the records of this store, reading each segment sequentially.
+
+		:returns: a generator of tuples containing the id and the record of each record.
+		"""
+		with self.lock:
+			if self.outfile != None:
+				self.outfile.flush()
+			locations = {(location[0], location[1]): record_id for record_id, location in self.records.items()}
+			segments = sorted(self.sizes)
+		for segment in segments:
+			if os.path.exists(self.segment_filename(segment)):
+				for offset, length, record in self.scan_segment(segment):
+					record_id = locations.get((segment, offset))
+					if record_id != None:
+						yield record_id, record
+
+	def compact(self, min_garbage_ratio = 0.5):
+		"""
+		Compacts the segments of this store (except for the active one) having at least the given ratio
+		of garbage, by appending their live records to the active segment and deleting them.
+
+		:param min_garbage_ratio: the ratio of garbage bytes over all bytes above which a segment is compacted.
+		:returns: the number of compacted segments.
+		"""
+		compacted = 0
+		with self.lock:
+			if self.closed:
+				return compacted
+			for segment in sorted(self.sizes)[:-1]:
+				if self.sizes[segment] == 0 or self.garbage[segment] / self.sizes[segment] < min_garbage_ratio:
+					continue
+				with open(self.segment_filename(segment), 'rb') as infile:
+					data = infile.read()
+				for record_id, location in list(self.records.items()):
+					if location[0] == segment:
+						chunk = data[location[1]:location[1] + location[2]]
+						if segment.endswith(".gz") != self.compress:
+							chunk = zlib.decompress(chunk, wbits = 31) if segment.endswith(".gz") else self.compress_data(chunk)
+						new_segment, offset = self.append(chunk)
+						self.records[record_id] = [new_segment, offset, len(chunk), location[3]]
+				self.sync()
+				os.remove(self.segment_filename(segment))
+				del self.sizes[segment]
+				del self.garbage[segment]
+				self.write_index()
+				compacted += 1
+		return compacted
+
+	def compress_data(self, data):
+		"""
+		Compresses data into a gzip member.
+
+		:param data: the data to be compressed.
+		:returns: the compressed data.
+		"""
+		compressor = zlib.compressobj(wbits = 31)
+		return compressor.compress(data) + compressor.flush()
+
+	def sync(self):
+		"""
+		Makes the appended records durable.
+		"""
+		if self.outfile != None:
+			self.outfile.flush()
+			os.fsync(self.outfile.fileno())
+
+	def flush(self):
+		"""
+		Makes the appended records durable and appends their locations to the index log, which is
+		also made durable. The index itself is not written, so a flush costs only as much as the
+		records that were appended since the previous flush.
+		"""
+		with self.lock:
+			self.sync()
+			if len(self.pending) > 0:
+				with open(self.log_filename(), 'a', encoding = 'utf-8') as outfile:
+					outfile.writelines(json.dumps(entry, ensure_ascii = False) + "\n" for entry in self.pending)
+					outfile.flush()
+					os.fsync(outfile.fileno())
+				self.pending = []
+
+	def write_index(self):
+		"""
+		Persists the whole index of this store and starts a new, empty index log. The index file is
+		replaced atomically, and it names its log, so that the log of the previous index is never
+		applied to it.
+		"""
+		self.generation += 1
+		index_filename = os.path.join(self.foldername, "index.json")
+		with open(index_filename + ".tmp", 'w', encoding = 'utf-8') as outfile:
+			json.dump({"sizes": self.sizes, "garbage": self.garbage, "records": self.records, "generation": self.generation}, outfile, ensure_ascii = False)
+		os.replace(index_filename + ".tmp", index_filename)
+		self.pending = []
+		for filename in os.listdir(self.foldername):
+			if filename.startswith("index.") and filename.endswith(".log") and filename != os.path.basename(self.log_filename()):
+				os.remove(os.path.join(self.foldername, filename))
+
+	def close_outfile(self):
+		"""
+		Closes the file of the active segment.
+		"""
+		if self.outfile != None:
+			self.outfile.close()
+			self.outfile = None
+
+	def close(self):
+		"""
+		Makes the appended records durable, writes the index, and closes this store.
+		"""
+		with self.lock:
+			self.sync()
+			self.write_index()
+			self.close_outfile()
+			self.closed = True
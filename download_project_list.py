@@ -1,10 +1,11 @@
 from helpers import get_number_of
 from logger.downloadlogger import Logger
 from downloader.jiradownloader import JiraDownloader
-from properties import JiraAPI, JiraCredentials, verbose, JiraWaitTimeInSeconds
+from downloader.ratelimiter import RateLimiter
+from properties import JiraAPI, JiraCredentials, verbose, JiraRequestsPerSecond, JiraRequestBurst, JiraConnectionPoolSize, JiraConcurrentRequests
 
 if __name__ == "__main__":
-	jd = JiraDownloader(JiraAPI, JiraCredentials, wait_time_in_seconds=JiraWaitTimeInSeconds)
+	jd = JiraDownloader(JiraAPI, JiraCredentials, rate_limiter=RateLimiter(JiraRequestsPerSecond, JiraRequestBurst), pool_size=JiraConnectionPoolSize, max_concurrent_requests=JiraConcurrentRequests)
 	lg = Logger(verbose)
 	projects = jd.download_object(JiraAPI + "project")
 	lg.start_action("Retrieving the number of issues for " + str(len(projects)) + " projects...", len(projects))
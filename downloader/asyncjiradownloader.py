@@ -0,0 +1,210 @@
+import sys
+import time
+import asyncio
+import aiohttp
+from collections import deque
+from downloader.ratelimiter import RateLimiter, get_request_class
+from downloader.jsondecoder import decode_json
+from downloader.jiradownloader import build_request_url, parse_headers
+
+class Response:
+	"""
+	Class that holds a response of the asyncio downloader after its body is read. It provides the
+	attributes of the responses of the requests library that are used by this tool.
+	"""
+	def __init__(self, url, status_code, headers, content, request_info):
+		"""
+		Initializes this response.
+
+		:param url: the URL of the request.
+		:param status_code: the HTTP status code of the response.
+		:param headers: the headers of the response.
+		:param content: the body of the response as bytes.
+		:param request_info: the info of the request as returned by aiohttp, which is included in the raised exceptions.
+		"""
+		self.url = url
+		self.request_info = request_info
+		self.status_code = status_code
+		self.headers = headers
+		self.content = content
+		self.ok = status_code < 400
+
+	def raise_for_status(self):
+		"""
+		Raises an exception if the response has an HTTP error status code.
+		"""
+		if not self.ok:
+			raise aiohttp.ClientResponseError(self.request_info, (), status = self.status_code, message = "HTTP error for url " + self.url, headers = self.headers)
+
+class AsyncJiraDownloader:
+	"""
+	Class that implements an asyncio downloader for the Jira API v2. It provides the same methods
+	as JiraDownloader as coroutines, so that many requests (e.g. of different projects) are kept
+	in flight on a single event loop. To use this class, you must first open it, either by awaiting
+	the method open or by using it as an async context manager, and finally close it.
+	"""
+	def __init__(self, jira_url, username, password=None, rate_limiter=None, pool_size=10, max_concurrent_requests=1, max_retries=5):
+		"""
+		Initializes this asyncio Jira API Downloader.
+
+		:param jira_url: the API URL where Jira is set up.
+		:param username: the Jira username (or the credentials as a tuple if no password is given).
+		:param password: the Jira password (or None if the credentials are given as a tuple in the username parameter).
+		:param rate_limiter: the RateLimiter that controls the requests, shared between downloaders that access the same server
+		                     (default is a limiter of one request per second).
+		:param pool_size: the number of keep-alive connections that are kept open to the Jira server.
+		:param max_concurrent_requests: the number of pages of a paginated object that are downloaded concurrently.
+		:param max_retries: the number of times a request is sent when the server throttles it (HTTP 429 or 503).
+		"""
+		self.jira_url = jira_url
+		self.credentials = (username, password) if password != None else username
+		self.rate_limiter = rate_limiter if rate_limiter != None else RateLimiter(1)
+		self.pool_size = pool_size
+		self.max_concurrent_requests = max_concurrent_requests
+		self.max_retries = max_retries
+		self.session = None
+
+	async def __aenter__(self):
+		await self.open()
+		return self
+
+	async def __aexit__(self, exc_type, exc_value, traceback):
+		await self.close()
+
+	async def open(self):
+		"""
+		Opens the HTTP session of this downloader and checks the credentials.
+		"""
+		self.session = aiohttp.ClientSession(auth = aiohttp.BasicAuth(*self.credentials),
+											 headers = {"Accept": "application/json", "Accept-Encoding": "gzip, deflate"},
+											 connector = aiohttp.TCPConnector(limit = self.pool_size))
+		if not await self.check_credentials(self.credentials):
+			await self.close()
+			sys.stdout.write("Wrong Credentials!\n")
+			exit()
+
+	async def close(self):
+		"""
+		Closes the HTTP session of this downloader.
+		"""
+		if self.session != None:
+			await self.session.close()
+			self.session = None
+
+	async def send_request(self, url, headers = None, auth = None):
+		"""
+		Sends a GET request after waiting for the rate limiter and reads its body. The response time
+		and status of the request are reported back to the rate limiter.
+
+		:param url: the full URL of the request.
+		:param headers: the headers of the request.
+		:param auth: the credentials of the request, default is the credentials of the session.
+		:returns: the response of the request as a Response object.
+		"""
+		delay = self.rate_limiter.reserve()
+		if delay > 0:
+			await asyncio.sleep(delay)
+		start = time.monotonic()
+		async with self.session.get(url, headers = headers, auth = aiohttp.BasicAuth(*auth) if auth else None) as response:
+			r = Response(url, response.status, response.headers, await response.read(), response.request_info)
+		self.rate_limiter.record_response(r.status_code, time.monotonic() - start, r.headers.get("Retry-After"), get_request_class(url, self.jira_url))
+		return r
+
+	async def check_credentials(self, credentials):
+		"""
+		Checks whether the credentials are correct.
+
+		:param credentials: the Jira credentials as a tuple (username, password).
+		:returns: True if the credentials are correct, or False otherwise.
+		"""
+		try:
+			r = await self.send_request(self.jira_url + "project", auth=credentials)
+			return r.status_code == 200
+		except (aiohttp.ClientError, asyncio.TimeoutError):
+			return False
+
+	async def download_request(self, address, parameters = None, headers = None):
+		"""
+		Implements a download request.
+
+		:param address: the URL of the request.
+		:param parameters: the parameters of the request.
+		:param headers: the headers of the request.
+		:returns: the response of the request as a Response object.
+		"""
+		url = build_request_url(address, parameters)
+		headers = parse_headers(headers)
+		for _ in range(self.max_retries):
+			try:
+				r = await self.send_request(url, headers = headers)
+			except asyncio.TimeoutError:
+				return None
+			if r.status_code not in (429, 503):
+				break
+		return r
+
+	async def download_object(self, address, parameters = None, per_page=50):
+		"""
+		Downloads an object of the Jira API.
+
+		:param address: the URL of the Jira request.
+		:param parameters: the parameters of the Jira request.
+		:param per_page: the number of objects per page if the object is paginated.
+		:returns: the contents of the response of the request.
+		"""
+		if parameters:
+			parameters.append("maxResults=" + str(per_page))
+		else:
+			parameters = ["maxResults=" + str(per_page)]
+		r = await self.download_request(address, parameters)
+		if r.ok:
+			content = decode_json(r.content) if r.status_code != 204 else {}
+			return content
+
+	async def download_page(self, address, parameters, start_at):
+		"""
+		Downloads a single page of a paginated object of the Jira API.
+
+		:param address: the URL of the Jira request.
+		:param parameters: the parameters of the Jira request.
+		:param start_at: the index of the first object of the page.
+		:returns: the contents of the page.
+		"""
+		r = await self.download_request(address, parameters + ["startAt=" + str(start_at)])
+		r.raise_for_status()
+		return decode_json(r.content)
+
+	async def download_paginated_object(self, address, object_name, parameters = None, per_page=50):
+		"""
+		Downloads a paginated object of the Jira API. After the first page, the remaining pages are
+		downloaded concurrently, keeping up to max_concurrent_requests pages in flight, and their
+		objects are returned in the order of the pages.
+
+		:param address: the URL of the Jira request.
+		:param object_name: the name of the object that is downloaded.
+		:param parameters: the parameters of the Jira request.
+		:param per_page: the number of objects per page.
+		:returns: an async generator containing all the objects of the response of the request.
+		"""
+		if parameters:
+			parameters.append("maxResults=" + str(per_page))
+		else:
+			parameters = ["maxResults=" + str(per_page)]
+		data = await self.download_page(address, parameters, 0)
+		for obj in data[object_name]:
+			yield obj
+
+		offsets = iter(range(data["startAt"] + data["maxResults"], data["total"], data["maxResults"]) if data["maxResults"] > 0 else [])
+		pending = deque()
+		try:
+			for start_at in offsets:
+				pending.append(asyncio.ensure_future(self.download_page(address, parameters, start_at)))
+				if len(pending) >= self.max_concurrent_requests:
+					for obj in (await pending.popleft())[object_name]:
+						yield obj
+			while pending:
+				for obj in (await pending.popleft())[object_name]:
+					yield obj
+		finally:
+			for task in pending:
+				task.cancel()
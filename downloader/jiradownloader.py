@@ -1,37 +1,265 @@
 import re
 import sys
-import json
 import time
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from urllib3.exceptions import TimeoutError
+from downloader.ratelimiter import RateLimiter, get_request_class
+from downloader.jsondecoder import decode_json
+from logger.metrics import metrics
+
+def build_request_url(address, parameters = None):
+	"""
+	Builds the URL of a request to the Jira API given its address and its parameters.
+
+	:param address: the URL of the request.
+	:param parameters: the parameters of the request as a list of "name=value" strings.
+	:returns: the full URL of the request.
+	"""
+	if parameters:
+		parameters = '?' + '&'.join(parameters)
+	else:
+		parameters = ""
+	reserved_keywords = ["EXEC", "TRANSACTION", "FOR"] # these project names are jql reserved keywords so they must be escaped
+	for keyword in reserved_keywords:
+		parameters = re.sub("project=" + keyword + "\\b", "project='" + keyword + "'", parameters)
+	return address + parameters
+
+def parse_headers(headers = None):
+	"""
+	Parses the headers of a request given as a "name: value" string.
+
+	:param headers: the headers of the request.
+	:returns: the headers as a dict.
+	"""
+	if headers:
+		return {headers.split(':')[0].strip() : headers.split(':')[1].strip()}
+	return {}
+
+# The tokens that are scanned to find the end of a JSON object, i.e. its brackets and its strings (complete or not)
+json_tokens = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|"|[\[\]{}]')
+
+class Page:
+	"""
+	Class that implements a page of a paginated object of the Jira API. The contents of the page are
+	decoded when they are first accessed, so that a page can be downloaded in one thread and decoded
+	in another one. If the page is given as a streamed response, then its contents are read from the
+	response only when needed, and its objects can be decoded one by one while they are read (see
+	method iter_objects), so that only one object of the page is held in memory at a time.
+	"""
+	def __init__(self, content = None, response = None, chunk_size = 65536):
+		"""
+		Initializes this page.
+
+		:param content: the encoded contents of the page.
+		:param response: the streamed response of the page, if content is not given.
+		:param chunk_size: the number of bytes that are read from the response at once.
+		"""
+		self.data = None
+		self.chunks = None
+		if response != None:
+			self.response = response
+			self.chunks = response.iter_content(chunk_size)
+			self.content = bytearray()
+			# Read the part of the page that precedes its objects, which includes the numbers of the page (e.g. total)
+			while self.content.find(b"[") < 0 and self.read_chunk():
+				pass
+		else:
+			self.content = content
+		end = self.content.find(b"[")
+		self.header = bytes(self.content[:end] if end >= 0 else self.content)
+
+	def __getitem__(self, key):
+		if self.data == None:
+			while self.read_chunk():
+				pass
+			self.data = decode_json(self.content)
+			self.content = None
+		return self.data[key]
+
+	def read_chunk(self):
+		"""
+		Reads the next chunk of the contents of the page from its streamed response.
+
+		:returns: True if a chunk is read, or False if the response is already read.
+		"""
+		if self.chunks != None:
+			for chunk in self.chunks:
+				if chunk:
+					self.content += chunk
+					return True
+			self.chunks = None
+			self.response.close()
+		return False
+
+	def raw(self):
+		"""
+		Returns the encoded contents of the page, reading the whole response if the page is given as a
+		streamed response. This method must be called before the page is decoded.
+
+		:returns: the encoded contents of the page.
+		"""
+		while self.read_chunk():
+			pass
+		return bytes(self.content)
+
+	def get_number(self, key):
+		"""
+		Returns a number of the page (e.g. total). If the page is not decoded yet, then the number is
+		read from the part of the page that precedes the objects of the page, without decoding the page.
+
+		:param key: the key of the number.
+		:returns: the number.
+		"""
+		if self.data == None:
+			match = re.search(b'"' + key.encode("utf-8") + rb'"\s*:\s*(\d+)', self.header)
+			if match:
+				return int(match.group(1))
+		return self[key]
+
+	def iter_objects(self, object_name):
+		"""
+		Returns the objects of the page. If the page is given as a streamed response, then each object
+		is decoded as soon as it is read, and it is discarded from the contents of the page, so the page
+		cannot be decoded as a whole afterwards (although its numbers are still available using get_number).
+
+		:param object_name: the name of the array of the objects (e.g. issues).
+		:returns: a generator containing the objects of the page.
+		"""
+		if self.data != None or self.chunks == None:
+			yield from self[object_name]
+			return
+		array = re.compile(rb'"' + re.escape(object_name.encode("utf-8")) + rb'"\s*:\s*\[')
+		match = array.search(self.content)
+		while match == None and self.read_chunk():
+			match = array.search(self.content)
+		if match == None:
+			yield from self[object_name]
+			return
+		position = match.end()
+		while True:
+			# Skip the separators before the next object
+			while position < len(self.content) and self.content[position] in b" \t\r\n,":
+				position += 1
+			if position == len(self.content):
+				if self.read_chunk():
+					continue
+				raise ValueError("Incomplete page of the Jira API")
+			if self.content[position] == ord("]"):
+				break
+			# Find the end of the object by matching its brackets, reading more chunks when the object is incomplete
+			depth = 0
+			scan = position
+			while True:
+				token = json_tokens.search(self.content, scan)
+				if token == None or token.group() == b'"':
+					scan = token.start() if token != None else len(self.content)
+					if not self.read_chunk():
+						raise ValueError("Incomplete page of the Jira API")
+					continue
+				scan = token.end()
+				if token.group() in (b"{", b"["):
+					depth += 1
+				elif token.group() in (b"}", b"]"):
+					depth -= 1
+					if depth == 0:
+						break
+			obj = decode_json(self.content[position:scan])
+			del self.content[:scan]
+			position = 0
+			yield obj
+		while self.read_chunk():
+			pass
 
 class JiraDownloader:
 	"""
 	Class that implements a downloader for the Jira API v2.
 	"""
-	def __init__(self, jira_url, username, password=None, wait_time_in_seconds=1):
+	def __init__(self, jira_url, username, password=None, rate_limiter=None, pool_size=10, max_concurrent_requests=1, max_retries=5, stream_pages=False, response_cache=None):
 		"""
 		Initializes this Jira API Downloader.
 
 		:param jira_url: the API URL where Jira is set up.
 		:param username: the Jira username (or the credentials as a tuple if no password is given).
 		:param password: the Jira password (or None if the credentials are given as a tuple in the username parameter).
-		:param wait_time_in_seconds: the time to wait until the next request.
+		:param rate_limiter: the RateLimiter that controls the requests, shared between downloaders that access the same server
+		                     (default is a limiter of one request per second).
+		:param pool_size: the number of keep-alive connections that are kept open to the Jira server.
+		:param max_concurrent_requests: the number of pages of a paginated object that are downloaded concurrently.
+		:param max_retries: the number of times a request is sent when the server throttles it (HTTP 429 or 503).
+		:param stream_pages: set to True to read the pages of paginated objects as streams, decoding their objects one by one.
+		:param response_cache: the ResponseCache where the responses are stored and served from, or None for no caching.
+		                       If the cache is offline, then no request is sent to the server, including the credentials check.
 		"""
 		self.jira_url = jira_url
 		self.credentials = (username, password) if password != None else username
-		self.wait_time_in_seconds = wait_time_in_seconds
-		if not self.check_credentials(self.credentials):
+		self.rate_limiter = rate_limiter if rate_limiter != None else RateLimiter(1)
+		self.max_retries = max_retries
+		self.max_concurrent_requests = max_concurrent_requests
+		self.stream_pages = stream_pages
+		self.response_cache = response_cache
+		self.session = self.create_session(self.credentials, pool_size)
+		if not (response_cache != None and response_cache.offline) and not self.check_credentials(self.credentials):
 			sys.stdout.write("Wrong Credentials!\n")
 			exit()
 
-	def wait_after_request(self):
+	def create_session(self, credentials, pool_size):
+		"""
+		Creates the HTTP session that is used for all requests. The session keeps the connections
+		to the server alive, so that consecutive requests do not repeat the TCP and TLS handshakes,
+		and it holds the authentication and the default headers of all requests.
+
+		:param credentials: the Jira credentials as a tuple (username, password).
+		:param pool_size: the maximum number of connections that are kept open per host.
+		:returns: the session object.
+		"""
+		session = requests.Session()
+		session.auth = credentials
+		session.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+		adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+		session.mount("https://", adapter)
+		session.mount("http://", adapter)
+		return session
+
+	def get_endpoint(self, url):
 		"""
-		Waits the specified amount of seconds after every request.
+		Returns the endpoint of a request, i.e. the first part of its address after the URL of the Jira API.
+
+		:param url: the URL of the request.
+		:returns: the endpoint (e.g. search).
+		"""
+		return url[len(self.jira_url):].split("?")[0].split("/")[0] if url.startswith(self.jira_url) else url
+
+	def send_request(self, url, headers = None, auth = None, stream = False):
+		"""
+		Sends a GET request after waiting for the rate limiter. The response time and status of the
+		request are reported back to the rate limiter, so that it adapts to the load of the server.
+		The requests, their latency, the size of their responses, and the time spent waiting for the
+		rate limiter are recorded in the metrics.
+
+		:param url: the full URL of the request.
+		:param headers: the headers of the request.
+		:param auth: the credentials of the request, default is the credentials of the session.
+		:param stream: set to True to read the body of the response only when it is accessed.
+		:returns: the response of the request.
 		"""
-		#sys.stdout.write('\nRequest made. Waiting for ' + str(self.wait_time_in_seconds) + ' seconds..')
-		time.sleep(self.wait_time_in_seconds)
-		#sys.stdout.write(' Done!!\n\n')
+		start = time.monotonic()
+		self.rate_limiter.acquire()
+		metrics.increment("jidownloader_rate_limiter_wait_seconds_total", time.monotonic() - start)
+		start = time.monotonic()
+		r = self.session.get(url, headers = headers, auth = auth, stream = stream)
+		latency = time.monotonic() - start
+		self.rate_limiter.record_response(r.status_code, latency, r.headers.get("Retry-After"), get_request_class(url, self.jira_url))
+		endpoint = self.get_endpoint(url)
+		metrics.increment("jidownloader_requests_total", endpoint = endpoint, status = str(r.status_code))
+		metrics.observe("jidownloader_request_duration_seconds", latency, endpoint = endpoint)
+		# The size of a streamed response is known only from its headers
+		size = r.headers.get("Content-Length")
+		if size != None or not stream:
+			metrics.increment("jidownloader_response_bytes_total", int(size) if size != None else len(r.content), endpoint = endpoint)
+		return r
 
 	def check_credentials(self, credentials):
 		"""
@@ -41,42 +269,53 @@ class JiraDownloader:
 		:returns: True if the credentials are correct, or False otherwise.
 		"""
 		try:
-			r = requests.get(self.jira_url + "project", auth=credentials)
+			r = self.send_request(self.jira_url + "project", auth=credentials)
 			if int(r.status_code) == 200:
-				self.wait_after_request()
 				return True
 			else:
 				return False
 		except:
 			return False
 
-	def download_request(self, address, parameters = None, headers = None):
+	def download_request(self, address, parameters = None, headers = None, stream = False):
 		"""
-		Implements a download request.
+		Implements a download request. If there is a response cache, then the response is served from the
+		cache when it is stored and not expired, and it is stored in the cache otherwise. Note that a cached
+		response is read fully, even when stream is True, while a response that is requested with stream set
+		to True is not stored, since storing it would read its whole body.
 
 		:param address: the URL of the request.
 		:param parameters: the parameters of the request.
 		:param headers: the headers of the request.
+		:param stream: set to True to read the body of the response only when it is accessed.
 		:returns: the response of the request.
 		"""
-		for _ in range(3):
-			try:
-				if parameters:
-					parameters = '?' + '&'.join(parameters)
-				else:
-					parameters = ""
-				if headers:
-					headers = {headers.split(':')[0].strip() : headers.split(':')[1].strip()}
-				else:
-					headers = {}
-				reserved_keywords = ["EXEC", "TRANSACTION", "FOR"] # these project names are jql reserved keywords so they must be escaped
-				for keyword in reserved_keywords:
-					parameters = re.sub("project=" + keyword + "\\b", "project='" + keyword + "'", parameters)
-				r = requests.get(address + parameters, headers = headers, auth = self.credentials)
-				self.wait_after_request()
+		url = build_request_url(address, parameters)
+		if self.response_cache != None:
+			endpoint = address[len(self.jira_url):] if address.startswith(self.jira_url) else address
+			if parameters and "maxResults=1" in parameters:
+				# Counts (i.e. requests of a single result) have their own time to live, separate from the pages of their endpoint
+				endpoint += "?count"
+			key = build_request_url(address, sorted(parameters) if parameters else None)
+			r = self.response_cache.get(endpoint, key)
+			if r != None:
+				metrics.increment("jidownloader_response_cache_hits_total", endpoint = self.get_endpoint(url))
 				return r
+			if self.response_cache.offline:
+				raise requests.exceptions.ConnectionError("The response of " + url + " is not in the response cache")
+		headers = parse_headers(headers)
+		for _ in range(self.max_retries):
+			try:
+				r = self.send_request(url, headers = headers, stream = stream)
 			except TimeoutError:
 				return None
+			if r.status_code not in (429, 503):
+				break
+			metrics.increment("jidownloader_retries_total", endpoint = self.get_endpoint(url))
+			r.close()
+		if self.response_cache != None and r != None and not stream:
+			self.response_cache.put(endpoint, key, r)
+		return r
 
 	def download_object(self, address, parameters = None, per_page=50):
 		"""
@@ -93,7 +332,7 @@ class JiraDownloader:
 			parameters = ["maxResults=" + str(per_page)]
 		r = self.download_request(address, parameters)
 		if r.ok:
-			content = json.loads(r.text or r.content) if r.status_code != 204 else {}
+			content = decode_json(r.content) if r.status_code != 204 else {}
 			return content
 
 	def download_paginated_object(self, address, object_name, parameters = None, per_page=50):
@@ -104,21 +343,89 @@ class JiraDownloader:
 		:param object_name: the name of the object that is downloaded.
 		:param parameters: the parameters of the Jira request.
 		:param per_page: the number of objects per page.
+		:returns: a generator containing all the objects of the response of the request.
+		"""
+		for page in self.download_paginated_pages(address, object_name, parameters, per_page):
+			for obj in page.iter_objects(object_name):
+				yield obj
+
+	def download_paginated_pages(self, address, object_name, parameters = None, per_page=50, start_at=0):
+		"""
+		Downloads the pages of a paginated object of the Jira API, in the order of their offsets. The
+		pages are returned as objects of type Page, which are decoded when their contents are accessed.
+
+		:param address: the URL of the Jira request.
+		:param object_name: the name of the object that is downloaded.
+		:param parameters: the parameters of the Jira request.
+		:param per_page: the number of objects per page.
+		:param start_at: the index of the first object of the first page, e.g. to resume an interrupted download.
 		:returns: a generator containing all the pages of the response of the request.
 		"""
 		if parameters:
 			parameters.append("maxResults=" + str(per_page))
 		else:
 			parameters = ["maxResults=" + str(per_page)]
-		r = self.download_request(address, parameters)
+		r = self.download_request(address, parameters + (["startAt=" + str(start_at)] if start_at > 0 else []), stream = self.stream_pages)
 		if r.ok:
-			data = json.loads(r.text or r.content)
-			for obj in data[object_name]:
-				yield obj
+			page = self.create_page(r)
+			yield page
+
+		if self.max_concurrent_requests > 1:
+			# All the remaining offsets are known after the first page, so download them concurrently
+			max_results = page.get_number("maxResults")
+			offsets = range(page.get_number("startAt") + max_results, page.get_number("total"), max_results) if max_results > 0 else []
+			yield from self.download_pages_concurrently(address, parameters, offsets)
+			return
 
-		while data["startAt"] < data["total"] and len(data[object_name]) > 0:
-			r = self.download_request(address, parameters + ["startAt=" + str(data["startAt"] + data["maxResults"])])
+		while page.get_number("startAt") < page.get_number("total") and page.get_number("maxResults") > 0:
+			r = self.download_request(address, parameters + ["startAt=" + str(page.get_number("startAt") + page.get_number("maxResults"))], stream = self.stream_pages)
 			if r.ok:
-				data = json.loads(r.text or r.content)
-				for obj in data[object_name]:
-					yield obj
+				page = self.create_page(r)
+				yield page
+
+	def download_page(self, address, parameters, start_at):
+		"""
+		Downloads a single page of a paginated object of the Jira API.
+
+		:param address: the URL of the Jira request.
+		:param parameters: the parameters of the Jira request.
+		:param start_at: the index of the first object of the page.
+		:returns: the page as an object of type Page.
+		"""
+		r = self.download_request(address, parameters + ["startAt=" + str(start_at)], stream = self.stream_pages)
+		r.raise_for_status()
+		return self.create_page(r)
+
+	def create_page(self, r):
+		"""
+		Creates a page of a paginated object given the response of its request.
+
+		:param r: the response of the request.
+		:returns: the page as an object of type Page, which reads the response as a stream if stream_pages is True.
+		"""
+		return Page(response = r) if self.stream_pages else Page(r.content)
+
+	def download_pages_concurrently(self, address, parameters, offsets):
+		"""
+		Downloads the pages of a paginated object using a pool of max_concurrent_requests workers.
+		The number of pages that are downloaded ahead is bounded, and the pages are returned in
+		the order of their offsets.
+
+		:param address: the URL of the Jira request.
+		:param parameters: the parameters of the Jira request.
+		:param offsets: the indexes of the first object of each page.
+		:returns: a generator containing all the pages as objects of type Page.
+		"""
+		offsets = iter(offsets)
+		with ThreadPoolExecutor(max_workers = self.max_concurrent_requests) as executor:
+			pending = deque()
+			try:
+				for start_at in offsets:
+					pending.append(executor.submit(self.download_page, address, parameters, start_at))
+					if len(pending) >= 2 * self.max_concurrent_requests:
+						yield pending.popleft().result()
+				while pending:
+					yield pending.popleft().result()
+			finally:
+				for future in pending:
+					future.cancel()
@@ -0,0 +1,20 @@
+import json
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+def decode_json(content):
+	"""
+	Decodes the JSON contents of a response of the Jira API. The contents are parsed directly from
+	their bytes, which are always encoded in UTF-8 by the Jira API, so they are not converted to a
+	string first. If the package orjson is installed, then it is used instead of the (slower) json
+	module of the standard library.
+
+	:param content: the contents of the response as bytes or bytearray.
+	:returns: the decoded JSON object.
+	"""
+	if orjson != None:
+		return orjson.loads(content)
+	return json.loads(content)
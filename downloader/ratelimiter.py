@@ -0,0 +1,118 @@
+import re
+import time
+import threading
+from datetime import datetime, UTC
+from email.utils import parsedate_to_datetime
+
+class RateLimiter:
+	"""
+	Class that implements an adaptive token-bucket rate limiter. The limiter allows a number of
+	requests per second, measured from the start of each request, and can be shared by several
+	downloaders and threads. The rate is reduced when the server responds with HTTP 429 or 503
+	or when it becomes slower, and it is slowly restored up to the configured rate afterwards. The
+	latency of each class of requests (e.g. pages of issues or counts) is compared only against
+	earlier requests of the same class, since requests of different classes take different times.
+	"""
+	def __init__(self, requests_per_second, burst=1, min_requests_per_second=None, slow_response_factor=3, baseline_decay=0.01):
+		"""
+		Initializes this rate limiter.
+
+		:param requests_per_second: the maximum number of requests per second.
+		:param burst: the number of requests that may be sent at once after a period of inactivity.
+		:param min_requests_per_second: the rate below which the limiter does not back off, default is a tenth of requests_per_second.
+		:param slow_response_factor: the limiter backs off when the average latency of a class of requests becomes this many times
+		                             longer than its baseline, i.e. the fastest recent average latency of the class.
+		:param baseline_decay: the fraction by which the baseline of a class moves up towards its average latency on each
+		                       response, so that a lasting change of the latency of the server is eventually accepted.
+		"""
+		self.max_rate = requests_per_second
+		self.min_rate = min_requests_per_second if min_requests_per_second != None else requests_per_second / 10
+		self.rate = requests_per_second
+		self.burst = burst
+		self.slow_response_factor = slow_response_factor
+		self.baseline_decay = baseline_decay
+		self.next_slot = time.monotonic()
+		self.blocked_until = 0
+		self.average_latencies = {}
+		self.baseline_latencies = {}
+		self.lock = threading.Lock()
+
+	def reserve(self):
+		"""
+		Reserves the slot of the next request without blocking.
+
+		:returns: the number of seconds to wait before the request is sent.
+		"""
+		with self.lock:
+			now = time.monotonic()
+			interval = 1 / self.rate
+			slot = max(self.next_slot, now - (self.burst - 1) * interval, self.blocked_until)
+			self.next_slot = slot + interval
+			return max(0, slot - now)
+
+	def acquire(self):
+		"""
+		Blocks until the next request is allowed to be sent.
+		"""
+		delay = self.reserve()
+		if delay > 0:
+			time.sleep(delay)
+
+	def record_response(self, status_code, latency, retry_after=None, request_class=None):
+		"""
+		Adapts the rate of the limiter given the outcome of a request. Throttling responses (HTTP 429
+		and 503) halve the rate and block all requests for the time given by the server, responses
+		that are much slower than usual reduce the rate, and all other responses increase it again.
+
+		:param status_code: the HTTP status code of the response.
+		:param latency: the time in seconds from the start of the request until the response.
+		:param retry_after: the value of the Retry-After header of the response, if any.
+		:param request_class: the class of the request (see function get_request_class), default is a single class for all requests.
+		"""
+		with self.lock:
+			if status_code in (429, 503):
+				self.rate = max(self.min_rate, self.rate / 2)
+				wait_time = parse_retry_after(retry_after)
+				self.blocked_until = max(self.blocked_until, time.monotonic() + (wait_time if wait_time != None else 1 / self.rate))
+				return
+			average = self.average_latencies.get(request_class)
+			average = latency if average == None else 0.8 * average + 0.2 * latency
+			baseline = self.baseline_latencies.get(request_class)
+			baseline = average if baseline == None or average < baseline else baseline + self.baseline_decay * (average - baseline)
+			self.average_latencies[request_class] = average
+			self.baseline_latencies[request_class] = baseline
+			if average > self.slow_response_factor * baseline:
+				self.rate = max(self.min_rate, self.rate * 0.8)
+			else:
+				self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+def get_request_class(url, jira_url):
+	"""
+	Returns the class of a request for the rate limiter, i.e. its endpoint and its page size, so that
+	e.g. the pages of issues are not compared against the much smaller counts of issues.
+
+	:param url: the full URL of the request.
+	:param jira_url: the API URL where Jira is set up.
+	:returns: the class of the request (e.g. search?maxResults=50).
+	"""
+	endpoint = url[len(jira_url):].split("?")[0].split("/")[0] if url.startswith(jira_url) else url.split("?")[0]
+	match = re.search(r"[?&]maxResults=(\d+)", url)
+	return endpoint + ("?maxResults=" + match.group(1) if match else "")
+
+def parse_retry_after(retry_after):
+	"""
+	Parses the value of a Retry-After header, given either in seconds or as an HTTP date.
+
+	:param retry_after: the value of the header.
+	:returns: the number of seconds to wait, or None if the value is missing or invalid.
+	"""
+	if not retry_after:
+		return None
+	try:
+		return max(0, float(retry_after))
+	except ValueError:
+		pass
+	try:
+		return max(0, (parsedate_to_datetime(retry_after) - datetime.now(UTC)).total_seconds())
+	except (TypeError, ValueError):
+		return None
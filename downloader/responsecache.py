@@ -0,0 +1,117 @@
+import json
+import time
+import zlib
+import sqlite3
+import threading
+import requests
+from requests.structures import CaseInsensitiveDict
+
+class ResponseCache:
+	"""
+	Class that implements an on-disk cache of the responses of the Jira API, stored in an SQLite file.
+	The responses are stored with their bodies compressed, and they are keyed by their URL (with its
+	parameters sorted). Each endpoint (e.g. field, project, or search) has its own time to live, while
+	the least recently used responses are evicted when the size of the cache exceeds its limit. In
+	offline mode, all the stored responses are served regardless of their age, and a request that is
+	not stored fails, so that a run can be replayed without sending any request to the server.
+	"""
+	def __init__(self, filename, max_size_in_bytes, ttls_in_seconds, offline = False):
+		"""
+		Initializes this cache.
+
+		:param filename: the path to the SQLite file of the cache.
+		:param max_size_in_bytes: the maximum size of the stored (compressed) bodies.
+		:param ttls_in_seconds: a dict containing endpoints (e.g. "project", "project/MYPROJECT", or "search?count" for the counts
+		                        of the search endpoint) as keys and their times to live as values; the responses of the endpoints
+		                        that are not included are not stored, and the ones of endpoints with a time to live of 0 are stored
+		                        only for offline use.
+		:param offline: set to True to serve only stored responses, regardless of their age.
+		"""
+		self.max_size_in_bytes = max_size_in_bytes
+		self.ttls_in_seconds = ttls_in_seconds
+		self.offline = offline
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(filename, timeout = 60, check_same_thread = False)
+		with self.lock, self.connection:
+			self.connection.execute("PRAGMA journal_mode=WAL")
+			self.connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, status_code INTEGER, headers TEXT, "
+									"body BLOB, size INTEGER, stored REAL, accessed REAL)")
+			self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+			# The size of the stored bodies, kept while storing responses, so that it is not summed at each insert
+			self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+	def get_ttl(self, endpoint):
+		"""
+		Returns the time to live of an endpoint, given by its longest matching endpoint in ttls_in_seconds.
+		The counts of an endpoint (e.g. search?count) have the time to live of the endpoint, unless they
+		are included in ttls_in_seconds.
+
+		:param endpoint: the endpoint, i.e. the address of a request relative to the URL of the Jira API.
+		:returns: the time to live in seconds, or None if the responses of the endpoint are not stored.
+		"""
+		if endpoint.endswith("?count") and endpoint not in self.ttls_in_seconds:
+			endpoint = endpoint[:-len("?count")]
+		matches = [key for key in self.ttls_in_seconds if endpoint == key or endpoint.startswith(key + "/")]
+		return self.ttls_in_seconds[max(matches, key = len)] if len(matches) > 0 else None
+
+	def get(self, endpoint, key):
+		"""
+		Returns a stored response, if it has not expired.
+
+		:param endpoint: the endpoint of the request.
+		:param key: the key of the request, i.e. its URL with its parameters sorted.
+		:returns: the response as an object of type requests.Response, or None if it is not stored or it has expired.
+		"""
+		ttl = self.get_ttl(endpoint)
+		if ttl == None and not self.offline:
+			return None
+		with self.lock:
+			row = self.connection.execute("SELECT status_code, headers, body, stored FROM responses WHERE key = ?", (key, )).fetchone()
+			if row == None or (not self.offline and time.time() - row[3] >= ttl):
+				return None
+			with self.connection:
+				self.connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+		r = requests.models.Response()
+		r.status_code = row[0]
+		r.reason = "OK"
+		r.headers = CaseInsensitiveDict(json.loads(row[1]))
+		r.url = key
+		r._content = zlib.decompress(row[2])
+		r._content_consumed = True
+		return r
+
+	def put(self, endpoint, key, r):
+		"""
+		Stores a successful response, if the responses of its endpoint are stored, and evicts the least
+		recently used responses if the cache exceeds its size.
+
+		:param endpoint: the endpoint of the request.
+		:param key: the key of the request, i.e. its URL with its parameters sorted.
+		:param r: the response as an object of type requests.Response.
+		"""
+		if r.status_code != 200 or self.get_ttl(endpoint) == None:
+			return
+		body = zlib.compress(r.content)
+		headers = {name: value for name, value in r.headers.items() if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")}
+		now = time.time()
+		with self.lock, self.connection:
+			replaced = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key, )).fetchone()
+			self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+									(key, r.status_code, json.dumps(headers), body, len(body), now, now))
+			self.size += len(body) - (replaced[0] if replaced != None else 0)
+			if self.size > self.max_size_in_bytes:
+				# The file may be shared with other processes, so the size is summed again before evicting
+				self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+				if self.size > self.max_size_in_bytes:
+					for evicted_key, evicted_size in self.connection.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+						if self.size <= self.max_size_in_bytes:
+							break
+						self.connection.execute("DELETE FROM responses WHERE key = ?", (evicted_key, ))
+						self.size -= evicted_size
+
+	def close(self):
+		"""
+		Closes the SQLite file of this cache.
+		"""
+		with self.lock:
+			self.connection.close()
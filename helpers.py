@@ -1,5 +1,37 @@
-import json
+from datetime import datetime, UTC
 from dateutil.parser import parse
+from downloader.jsondecoder import decode_json
+
+def parse_datetime(value):
+	"""
+	Parses a datetime string. The fixed format of the Jira API (e.g. 2021-03-04T10:11:12.000+0000)
+	is parsed by the ISO-8601 parser of the standard library, while any other format falls back to
+	the generic (and much slower) parser of dateutil.
+
+	:param value: the datetime string to be parsed.
+	:returns: the datetime object.
+	"""
+	try:
+		return datetime.fromisoformat(value)
+	except (TypeError, ValueError):
+		return parse(value)
+
+def normalize_datetime(value):
+	"""
+	Normalizes a datetime, so that the datetimes of the Jira API can be compared to the ones that are
+	stored, i.e. the naive UTC datetimes of MongoDB (having millisecond precision) or the strings that
+	are written to disk.
+
+	:param value: the datetime object or datetime string to be normalized.
+	:returns: a naive datetime object in UTC with millisecond precision, or None if value is None.
+	"""
+	if value == None:
+		return None
+	if isinstance(value, str):
+		value = parse_datetime(value)
+	if value.tzinfo != None:
+		value = value.astimezone(UTC).replace(tzinfo=None)
+	return value.replace(microsecond=value.microsecond // 1000 * 1000)
 
 def process_field(jiraobject, fieldkey, fieldtype="datetime", fieldvalue=None):
 	"""
@@ -18,9 +50,9 @@ def process_field(jiraobject, fieldkey, fieldtype="datetime", fieldvalue=None):
 	elif fieldtype == "float":
 		jiraobject[fieldkey] = float(fieldvalue)
 	elif fieldtype == "datetime":
-		jiraobject[fieldkey] = parse(fieldvalue)
+		jiraobject[fieldkey] = parse_datetime(fieldvalue)
 	elif fieldkey == "lastpubliccommentdate":
-		jiraobject[fieldkey] = parse(fieldvalue)
+		jiraobject[fieldkey] = parse_datetime(fieldvalue)
 	else:
 		jiraobject[fieldkey] = fieldvalue
 
@@ -65,7 +97,20 @@ def get_issue_fields(jdownloader, custom_fields_api_address):
 	:returns: a dictionary containing the old field keys as keys and the new field keys as values
 	          and a dictionary containing the old field keys as keys and the types as values.
 	"""
-	fields = jdownloader.download_object(custom_fields_api_address)
+	return compute_issue_fields(jdownloader.download_object(custom_fields_api_address))
+
+def compute_issue_fields(fields, previous_fieldids = None):
+	"""
+	Computes the keys and the types of the fields of a Jira instance, as returned by get_issue_fields.
+	If the keys of a previous computation are given, then the fields that exist in them keep their
+	previous keys, so that the renaming of the custom fields stays the same when fields are added.
+
+	:param fields: the fields of the Jira instance, as downloaded from the API.
+	:param previous_fieldids: a dictionary containing the old field keys as keys and the previous new field keys as values.
+	:returns: a dictionary containing the old field keys as keys and the new field keys as values
+	          and a dictionary containing the old field keys as keys and the types as values.
+	"""
+	previous_fieldids = previous_fieldids or {}
 	fieldids = {}
 	fieldtypes = {}
 	for field in [field for field in fields if not field["custom"]]:
@@ -75,13 +120,17 @@ def get_issue_fields(jdownloader, custom_fields_api_address):
 			fieldtypes[field["id"]] = "float"
 		elif fieldtypes[field["id"]] == "number":
 			fieldtypes[field["id"]] = "int"
+	reserved_fieldids = set(previous_fieldids.values())
 	for field in [field for field in fields if field["custom"]]:
-		fieldid = "".join(c.lower() for c in field["name"] if c.isalnum())
-		if fieldid in fieldids.values():
-			i = 2
-			while fieldid + str(i) in fieldids.values():
-				i += 1
-			fieldid = fieldid + str(i)
+		if field["id"] in previous_fieldids:
+			fieldid = previous_fieldids[field["id"]]
+		else:
+			fieldid = "".join(c.lower() for c in field["name"] if c.isalnum())
+			if fieldid in fieldids.values() or fieldid in reserved_fieldids:
+				i = 2
+				while fieldid + str(i) in fieldids.values() or fieldid + str(i) in reserved_fieldids:
+					i += 1
+				fieldid = fieldid + str(i)
 		fieldids[field["id"]] = fieldid
 		fieldtypes[field["id"]] = field.get("schema", {"type": None})["type"]
 		if fieldtypes[field["id"]] == "number" and "schema" in field and "custom" in field["schema"] and field["schema"]["custom"].endswith("float"):
@@ -90,15 +139,63 @@ def get_issue_fields(jdownloader, custom_fields_api_address):
 			fieldtypes[field["id"]] = "int"
 	return fieldids, fieldtypes
 
-def get_size_of_json_object_in_KB(json_obj):
+def compute_requested_fields(fieldids, field_profile, required_fields = ("comment", "created", "project", "updated", "worklog")):
 	"""
-	Returns the size of a json object in KB. This is used to check that the relevant record can
-	be stored to databases having a document size limitation.
+	Computes the fields of the issues that are requested from the Jira API given a field profile, that
+	is a list of fields given either by their original keys (e.g. customfield_10000) or by their new
+	keys as returned by get_issue_fields (e.g. description). The fields that are required for processing
+	the issues are always requested.
 
-	:param json_obj: the json object of which the size is measured.
-	:returns: the size of the given json object in KB.
+	:param fieldids: a dictionary containing the old field keys as keys and the new field keys as values.
+	:param field_profile: the list of the fields to be requested, or None to request all the fields.
+	:param required_fields: the original keys of the fields that are always requested.
+	:returns: the value of the fields parameter of the request, e.g. "*all" or "comment,created,project,summary,updated,worklog".
 	"""
-	return len(json.dumps(json_obj, indent = 4, default=str).encode("utf-8")) / 1024
+	if field_profile == None:
+		return "*all"
+	oldfieldids = {fieldkey: key for key, fieldkey in fieldids.items()}
+	requested = set(required_fields)
+	for field in field_profile:
+		requested.add(field if field in fieldids else oldfieldids.get(field, field))
+	return ",".join(sorted(requested))
+
+def compile_field_converters(fieldids, fieldtypes):
+	"""
+	Compiles the conversions of the fields of the issues, given the field keys and types returned by
+	get_issue_fields, so that the fields of each issue are converted without looking up their keys
+	and their types. The result is a dictionary having the original key of each field as key and a
+	tuple of the new key of the field and its converter (or None if the value is kept as-is) as value,
+	for example {"created": ("created", parse_datetime), "custom2442": ("description", None), ...}.
+
+	:param fieldids: a dictionary containing the old field keys as keys and the new field keys as values.
+	:param fieldtypes: a dictionary containing the old field keys as keys and the types as values.
+	:returns: a dictionary containing the old field keys as keys and tuples of new keys and converters as values.
+	"""
+	converters = {"int": int, "float": float, "datetime": parse_datetime}
+	fieldconverters = {}
+	for key, fieldkey in fieldids.items():
+		converter = converters.get(fieldtypes.get(key, None), None)
+		if converter == None and fieldkey == "lastpubliccommentdate":
+			converter = parse_datetime
+		fieldconverters[key] = (fieldkey, converter)
+	return fieldconverters
+
+def convert_fields(issue, fieldconverters):
+	"""
+	Converts the fields of an issue given the conversions returned by compile_field_converters. The
+	non-null fields of issue["fields"] are renamed, converted, and set as fields of the issue, as done
+	by calling process_field for each one of them.
+
+	:param issue: the issue of which the fields are converted.
+	:param fieldconverters: a dictionary containing the old field keys as keys and tuples of new keys and converters as values.
+	"""
+	for key, value in issue["fields"].items():
+		if value != None:
+			conversion = fieldconverters.get(key, None)
+			if conversion == None:
+				conversion = (key, parse_datetime if key == "lastpubliccommentdate" else None)
+			fieldkey, converter = conversion
+			issue[fieldkey] = converter(value) if converter != None else value
 
 def get_number_of(jdownloader, project_api_address, parameter = None):
 	"""
@@ -111,7 +208,7 @@ def get_number_of(jdownloader, project_api_address, parameter = None):
 	:returns: the value for the statistic as an absolute number.
 	"""
 	r = jdownloader.download_request(project_api_address, ["maxResults=1"] if parameter == None else ["maxResults=1", parameter])
-	data = json.loads(r.text or r.content) if r.status_code != 204 else {}
+	data = decode_json(r.content) if r.status_code != 204 else {}
 	return data["total"]
 
 def read_file_in_lines(filename):
@@ -125,6 +222,22 @@ def read_file_in_lines(filename):
 		lines = infile.readlines()
 	return [line.strip().split(';')[0] for line in lines]
 
+def read_projects_by_size(filename):
+	"""
+	Reads a file of projects and returns the project names sorted by their number of issues in
+	descending order. The file is comma-separated with ';' and the number of issues of each project
+	is in its third column (as written by download_project_list.py). Projects without a number of
+	issues are placed last, keeping their order in the file.
+
+	:param filename: the filename of the file to be read.
+	:returns: a list with the project names, largest first.
+	"""
+	with open(filename) as infile:
+		lines = [line.strip().split(';') for line in infile.readlines()]
+	sizes = [int(line[2]) if len(line) > 2 and line[2].strip().isdigit() else 0 for line in lines]
+	order = sorted(range(len(lines)), key = lambda i: -sizes[i])
+	return [lines[i][0] for i in order]
+
 def print_usage():
 	"""
 	Prints the usage information of this python file.
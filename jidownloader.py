@@ -1,24 +1,198 @@
 import os
 import sys
+import json
+import time
+import threading
 import traceback
-from datetime import datetime, UTC
+import multiprocessing
+from collections import deque
+from datetime import datetime, timedelta, UTC
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from pipeline import ProducerThread, ConsumerThread
 from logger.downloadlogger import Logger
+from logger.metrics import metrics
 from datamanager.dbmanager import DBManager
 from datamanager.mongomanager import MongoDBManager
+from datamanager.segmentmanager import SegmentDBManager
+from datamanager.fieldcache import FieldCache
+from datamanager.pagearchive import PageArchive
 from downloader.jiradownloader import JiraDownloader
-from helpers import get_number_of, print_usage, read_file_in_lines, get_issue_fields, extract_users, process_field
-from properties import JiraAPI, JiraCredentials, JiraWaitTimeInSeconds, update_existing_projects, verbose, use_database
+from downloader.ratelimiter import RateLimiter
+from downloader.responsecache import ResponseCache
+from downloader.jsondecoder import decode_json
+from helpers import get_number_of, print_usage, read_file_in_lines, read_projects_by_size, compute_requested_fields, compile_field_converters, convert_fields, extract_users, process_field, normalize_datetime
+from properties import JiraAPI, JiraCredentials, JiraRequestsPerSecond, JiraRequestBurst, JiraConnectionPoolSize, JiraConcurrentRequests, JiraStreamPages, update_existing_projects, verbose, use_database
+from properties import parallel_projects, parallel_projects_mode, field_cache_path, field_cache_ttl_in_seconds, field_cache_revalidate, incremental_overlap_in_minutes
+from properties import issue_fields_profile, changelog_workers, pipeline_queue_size
+from properties import response_cache_path, response_cache_size_in_MB, response_cache_ttls_in_seconds, response_cache_offline
+from properties import page_archive_path, page_archive_compression_level
+from properties import metrics_jsonl_path, metrics_prometheus_path, metrics_interval_in_seconds
 
-# Initialize all required objects
-db = MongoDBManager() if use_database == 'mongo' else DBManager()
-lg = Logger(verbose)
-jd = JiraDownloader(JiraAPI, JiraCredentials, wait_time_in_seconds=JiraWaitTimeInSeconds)
+# The DB manager and the downloader of each worker of a parallel crawl
+worker = threading.local()
 
-def download_project(project_name):
+# The fields of the Jira instance, shared by all the projects of a run
+field_cache = FieldCache(field_cache_path, field_cache_ttl_in_seconds, field_cache_revalidate)
+
+# The archive of the raw responses of the crawls, or None if the responses are not archived
+page_archive = PageArchive(page_archive_path, page_archive_compression_level) if page_archive_path != None else None
+
+def create_db_manager():
+	"""
+	Creates the DB manager that is selected in the properties.
+
+	:returns: an instance of MongoDBManager, SegmentDBManager, or DBManager.
+	"""
+	if use_database == 'mongo':
+		return MongoDBManager()
+	elif use_database == 'segments':
+		return SegmentDBManager()
+	return DBManager()
+
+def create_jira_downloader(rate_limiter):
+	"""
+	Creates a Jira downloader given the properties.
+
+	:param rate_limiter: the rate limiter of the downloader.
+	:returns: an instance of JiraDownloader.
+	"""
+	response_cache = None
+	if response_cache_path != None:
+		response_cache = ResponseCache(response_cache_path, response_cache_size_in_MB * 1024 * 1024, response_cache_ttls_in_seconds, response_cache_offline)
+	return JiraDownloader(JiraAPI, JiraCredentials, rate_limiter=rate_limiter, pool_size=JiraConnectionPoolSize, max_concurrent_requests=JiraConcurrentRequests,
+						 stream_pages=JiraStreamPages, response_cache=response_cache)
+
+def download_changelog(jd, issue_key, project_name, crawldatetime):
+	"""
+	Downloads the full changelog of an issue. The search endpoint returns at most 100 histories per
+	issue, while the issue endpoint returns all of them. The response is archived if there is an archive.
+
+	:param jd: the Jira downloader.
+	:param issue_key: the key of the issue.
+	:param project_name: the name of the project of the issue.
+	:param crawldatetime: the time that the crawl of the project started.
+	:returns: the histories of the changelog of the issue.
+	"""
+	r = jd.download_request(JiraAPI + "issue/" + issue_key, ["fields=updated", "expand=changelog"])
+	r.raise_for_status()
+	if page_archive != None:
+		page_archive.append(project_name, crawldatetime, "changelog", r.content, {"key": issue_key})
+	return decode_json(r.content)["changelog"]["histories"]
+
+def archive_pages(pages, project_name, crawldatetime):
+	"""
+	Archives the pages of issues of a crawl as they are downloaded.
+
+	:param pages: the generator of the pages.
+	:param project_name: the name of the project.
+	:param crawldatetime: the time that the crawl of the project started.
+	:returns: a generator containing the pages.
+	"""
+	for page in pages:
+		page_archive.append(project_name, crawldatetime, "search", page.raw())
+		yield page
+
+def process_events(project, db, issue_id, histories, writes):
+	"""
+	Processes the events of an issue, extracting their users.
+
+	:param project: the project data.
+	:param db: the DB manager where the data are written.
+	:param issue_id: the id of the issue.
+	:param histories: the histories of the changelog of the issue.
+	:param writes: the list where the writes of the events and their users are added.
+	"""
+	for event in histories:
+		# Extract users
+		for user in extract_users(event, JiraAPI):
+			if not project.user_exists(user):
+				project.add_user(user)
+				writes.append((db.write_project_user_to_disk, user))
+		event["issue"] = issue_id
+		process_field(event, "created")
+		project.add_event(event)
+		writes.append((db.write_project_event_to_disk, event))
+
+def process_issue(project, db, issue, fieldids, fieldconverters, nonnullfields, writes, histories):
+	"""
+	Processes an issue, converting its fields and extracting its users, events, comments, and worklogs.
+
+	:param project: the project data.
+	:param db: the DB manager where the data are written.
+	:param issue: the issue as returned by the search of the Jira API.
+	:param fieldids: a dict containing the Jira keys of the fields as keys and the keys they are stored under as values.
+	:param fieldconverters: the converters of the fields, as returned by compile_field_converters.
+	:param nonnullfields: the set where the stored keys of the non-null fields of the issue are added.
+	:param writes: the list where the writes of the issue and its records are added.
+	:param histories: the histories of the changelog of the issue, or None if its events are processed separately.
+	"""
+	# Process fields
+	nonnullfields.update(fieldids.get(key, key) for key, value in issue["fields"].items() if value != None)
+	convert_fields(issue, fieldconverters)
+
+	# Extract users
+	for user in extract_users(issue, JiraAPI):
+		if not project.user_exists(user):
+			project.add_user(user)
+			writes.append((db.write_project_user_to_disk, user))
+	# Extract events
+	if histories != None:
+		process_events(project, db, issue["id"], histories, writes)
+	# Extract comments
+	for comment in issue["fields"]["comment"]["comments"]:
+		# Extract users
+		for user in extract_users(comment, JiraAPI):
+			if not project.user_exists(user):
+				project.add_user(user)
+				writes.append((db.write_project_user_to_disk, user))
+		comment["issue"] = issue["id"]
+		process_field(comment, "created")
+		process_field(comment, "updated")
+		project.add_comment(comment)
+		writes.append((db.write_project_comment_to_disk, comment))
+	# Extract worklog
+	if "worklog" in issue["fields"]:
+		for worklog in issue["fields"]["worklog"]["worklogs"]:
+			# Extract users
+			for user in extract_users(worklog, JiraAPI):
+				if not project.user_exists(user):
+					project.add_user(user)
+					writes.append((db.write_project_user_to_disk, user))
+			worklog["issue"] = issue["id"]
+			process_field(worklog, "created")
+			process_field(worklog, "updated")
+			process_field(worklog, "started")
+			project.add_worklog(worklog)
+			writes.append((db.write_project_worklog_to_disk, worklog))
+	# Clean up unused fields
+	del issue["fields"]
+	del issue["project"]
+	del issue["changelog"]
+	del issue["comment"]
+	if "worklog" in issue:
+		del issue["worklog"]
+	project.add_issue(issue)
+	writes.append((db.write_project_issue_to_disk, issue))
+
+def write_records(project_name, writes):
+	"""
+	Writes the records of a page of issues, in the order they were processed.
+
+	:param project_name: the name of the project.
+	:param writes: a list of tuples containing a write method of the DB manager and the record to be written.
+	"""
+	for write, record in writes:
+		write(project_name, record)
+
+def download_project(project_name, db, lg, jd):
 	"""
 	Downloads all the data of a project given its Jira name.
 
 	:param project_name: the name of the projects of which the data are downloaded.
+	:param db: the DB manager where the data are written.
+	:param lg: the logger of the download.
+	:param jd: the Jira downloader.
 	"""
 	project_custom_fields_api_address = JiraAPI + "field"
 	project_api_address = JiraAPI + "project/" + project_name
@@ -38,87 +212,113 @@ def download_project(project_name):
 	if project_update:
 		last_crawled = project.last_crawled()
 		last_crawl_complete = project.last_crawl_complete()
-		print("Project last crawled: " + (str(last_crawled) if last_crawled else "never") + " (crawl " + ("successful" if last_crawl_complete else "unsuccesful") + ")")
-		print("Project last updated: " + (str(project.last_updated()) if project.last_updated() else "never"))
+		lg.log_action("Project last crawled: " + (str(last_crawled) if last_crawled else "never") + " (crawl " + ("successful" if last_crawl_complete else "unsuccesful") + ")")
+		lg.log_action("Project last updated: " + (str(project.last_updated()) if project.last_updated() else "never"))
 
 	crawldatetime = datetime.now(UTC).replace(microsecond=0)
+	cursor = db.read_project_cursor(project_name) if project_update and not last_crawl_complete else None
+	if cursor != None:
+		# The resumed crawl keeps the start time of the interrupted crawl, so that the next update does not miss any issue
+		crawldatetime = datetime.fromisoformat(cursor["crawldatetime"])
+	lastcrawlcomplete = False
+	changelog_executor = ThreadPoolExecutor(max_workers = changelog_workers)
+	pending_changelogs = deque()
+	pages = None
+	writer = None
+	nonnullfields = set(project["info"].get("nonnullfields", [])) if project["info"] else set()
 	try:
-		fieldids, fieldtypes = get_issue_fields(jd, project_custom_fields_api_address)
+		fieldids, fieldtypes = field_cache.get_issue_fields(jd, project_custom_fields_api_address)
+		fieldconverters = compile_field_converters(fieldids, fieldtypes)
 
 		project_info = jd.download_object(project_api_address)
+		if page_archive != None:
+			page_archive.append(project_name, crawldatetime, "project", json.dumps(project_info).encode("utf-8"))
 		project.add_info(project_info)
+		# The downloaded info replaces the stored one, so the non-null fields of the stored issues are put back
+		project["info"]["nonnullfields"] = sorted(nonnullfields)
 		db.write_project_info_to_disk(project_name, project["info"])
 
-		jql_query = "jql=project=" + project_name
-		if project_update and last_crawl_complete:
-			jql_query += " AND updatedDate > '" + str(last_crawled)[:-3] + "'"
+		if cursor != None:
+			# Resume the interrupted crawl from the creation datetime of its last durable issue (rounded down to minutes since
+			# JQL does not support seconds), instead of from an offset, since issues that were updated while the crawl was
+			# interrupted may have entered the results before that issue; the issues created in that minute that are already
+			# stored are downloaded again, but they are not written again unless they have changed
+			jql_filter = cursor["jql"]
+			jql_query = jql_filter + " AND created >= '" + normalize_datetime(cursor["lastcreated"]).strftime("%Y-%m-%d %H:%M") + "'"
+			lg.log_action("Resuming interrupted crawl after issue " + str(cursor["lastissue"]) + " (created " + str(cursor["lastcreated"]) + ")")
+		else:
+			jql_filter = "jql=project=" + project_name
+			if project_update and last_crawl_complete:
+				# Continue from the last update of the stored issues (or from the last crawl if there are none), going back
+				# by an overlap window, and rounding down to minutes since JQL does not support seconds; the last crawl also
+				# bounds the watermark, since issues that were updated during that crawl may have been missed by it
+				watermark = normalize_datetime(project.last_updated() or last_crawled)
+				if last_crawled != None:
+					watermark = min(watermark, normalize_datetime(last_crawled))
+				watermark -= timedelta(minutes=incremental_overlap_in_minutes)
+				jql_filter += " AND updatedDate > '" + watermark.strftime("%Y-%m-%d %H:%M") + "'"
+			jql_query = jql_filter
+		# Issues are sorted by creation, so that the crawl can be resumed from the creation datetime of its last issue
+		jql_query += " ORDER BY created ASC"
 
 		project_issues_address = JiraAPI + "search"
 		number_of_issues = get_number_of(jd, project_issues_address, jql_query)
-		issue_params = [jql_query, "fields=*all", "expand=changelog"]
+		issue_params = [jql_query, "fields=" + compute_requested_fields(fieldids, issue_fields_profile), "expand=changelog"]
 
 		lg.start_action("Retrieving " + str(number_of_issues) + " issues, including their events and comments...", number_of_issues)
-		for issue in jd.download_paginated_object(project_issues_address, "issues", issue_params):
-			# Process fields
-			for key, value in issue["fields"].items():
-				if value != None:
-					fieldtype = fieldtypes.get(key, None)
-					fieldkey = fieldids.get(key, key)
-					process_field(issue, fieldkey, fieldtype, value)
-
-			# Extract users
-			for user in extract_users(issue, JiraAPI):
-				if not project.user_exists(user):
-					project.add_user(user)
-					db.write_project_user_to_disk(project_name, user)
-			# Extract events
-			for event in issue["changelog"]["histories"]:
-				# Extract users
-				for user in extract_users(event, JiraAPI):
-					if not project.user_exists(user):
-						project.add_user(user)
-						db.write_project_user_to_disk(project_name, user)
-				event["issue"] = issue["id"]
-				process_field(event, "created")
-				project.add_event(event)
-				db.write_project_event_to_disk(project_name, event)
-			# Extract comments
-			for comment in issue["fields"]["comment"]["comments"]:
-				# Extract users
-				for user in extract_users(comment, JiraAPI):
-					if not project.user_exists(user):
-						project.add_user(user)
-						db.write_project_user_to_disk(project_name, user)
-				comment["issue"] = issue["id"]
-				process_field(comment, "created")
-				process_field(comment, "updated")
-				project.add_comment(comment)
-				db.write_project_comment_to_disk(project_name, comment)
-			# Extract worklog
-			if "worklog" in issue["fields"]:
-				for worklog in issue["fields"]["worklog"]["worklogs"]:
-					# Extract users
-					for user in extract_users(worklog, JiraAPI):
-						if not project.user_exists(user):
-							project.add_user(user)
-							db.write_project_user_to_disk(project_name, user)
-					worklog["issue"] = issue["id"]
-					process_field(worklog, "created")
-					process_field(worklog, "updated")
-					process_field(worklog, "started")
-					project.add_comment(worklog)
-					db.write_project_worklog_to_disk(project_name, worklog)
-			# Clean up unused fields
-			del issue["fields"]
-			del issue["project"]
-			del issue["changelog"]
-			del issue["comment"]
-			if "worklog" in issue:
-				del issue["worklog"]
-			project.add_issue(issue)
-			db.write_project_issue_to_disk(project_name, issue)
-			lg.step_action()
+		unchanged_issues = 0
+		# The pages are downloaded, processed, and written in separate threads, connected by bounded queues
+		pages = jd.download_paginated_pages(project_issues_address, "issues", issue_params)
+		if page_archive != None:
+			pages = archive_pages(pages, project_name, crawldatetime)
+		pages = ProducerThread(pages, pipeline_queue_size)
+		writer = ConsumerThread(partial(write_records, project_name), pipeline_queue_size)
+		# The issues of a streamed page are decoded one by one, so the update datetimes of all the stored issues are read once
+		stored_updated = db.read_project_issues_updated(project_name) if project_update and jd.stream_pages else {}
+		for page in pages:
+			writes = []
+			if project_update and not jd.stream_pages:
+				stored_updated = db.read_project_issues_updated(project_name, [issue["id"] for issue in page["issues"]])
+			num_page_issues = 0
+			for issue in page.iter_objects("issues"):
+				num_page_issues += 1
+				last_issue_key = issue["key"]
+				last_issue_created = issue["fields"]["created"]
+				if issue["id"] in stored_updated and normalize_datetime(stored_updated[issue["id"]]) == normalize_datetime(issue["fields"]["updated"]):
+					# The issue is already stored and has not changed since, so it is not written again
+					unchanged_issues += 1
+					metrics.increment("jidownloader_issues_unchanged_total", project = project_name)
+					lg.step_action()
+					continue
+				histories = issue["changelog"]["histories"]
+				if issue["changelog"]["total"] > len(histories):
+					# The changelog is truncated, so it is downloaded in the background and its events are processed later
+					pending_changelogs.append((issue["id"], changelog_executor.submit(download_changelog, jd, issue["key"], project_name, crawldatetime)))
+					histories = None
+				start = time.monotonic()
+				process_issue(project, db, issue, fieldids, fieldconverters, nonnullfields, writes, histories)
+				metrics.observe("jidownloader_issue_processing_seconds", time.monotonic() - start)
+				metrics.increment("jidownloader_issues_processed_total", project = project_name)
+				if len(pending_changelogs) > 2 * changelog_workers:
+					issue_id, future = pending_changelogs.popleft()
+					process_events(project, db, issue_id, future.result(), writes)
+				lg.step_action()
+			# Process the truncated changelogs of the page, so that its events are written before the cursor
+			while pending_changelogs:
+				issue_id, future = pending_changelogs.popleft()
+				process_events(project, db, issue_id, future.result(), writes)
+			# The cursor is written after the records of the page, so the crawl can be resumed after it
+			if num_page_issues > 0:
+				writes.append((db.write_project_cursor_to_disk, {"jql": jql_filter, "lastissue": last_issue_key, "lastcreated": last_issue_created,
+																 "crawldatetime": str(crawldatetime)}))
+			writer.put(writes)
+		writer.close()
 		lg.end_action()
+		if unchanged_issues > 0:
+			lg.log_action("Skipped " + str(unchanged_issues) + " unchanged issues")
+		if page_archive != None:
+			# Mark the archived crawl as complete
+			page_archive.append(project_name, crawldatetime, "complete", b"")
 		lastcrawlcomplete = True
 	except Exception:
 		# Catch any exception and print it before exiting
@@ -126,17 +326,91 @@ def download_project(project_name):
 		sys.exit(traceback.format_exc())
 	finally:
 		# This line of code is always executed even if an exception occurs
+		changelog_executor.shutdown(cancel_futures = True)
+		if pages != None:
+			pages.stop()
+		if writer != None:
+			writer.stop()
+		if project["info"]:
+			# Also keep the non-null fields of the issues that were written before a failure
+			project["info"]["nonnullfields"] = sorted(nonnullfields)
 		db.finalize_write_to_disk(project_name, project, crawldatetime, lastcrawlcomplete)
 
+def initialize_worker(rate_limiter, requests_per_second, separate_process = False):
+	"""
+	Initializes a worker of a parallel crawl, creating its own DB manager and Jira downloader.
+
+	:param rate_limiter: the rate limiter shared by all workers, or None to create a new one for this worker.
+	:param requests_per_second: the maximum number of requests per second of the new rate limiter.
+	:param separate_process: set to True if the worker is a separate process, which writes its own metrics.
+	"""
+	if separate_process:
+		metrics.start(metrics_jsonl_path, metrics_prometheus_path, metrics_interval_in_seconds, process_name = str(os.getpid()))
+	worker.db = create_db_manager()
+	worker.jd = create_jira_downloader(rate_limiter if rate_limiter != None else RateLimiter(requests_per_second, JiraRequestBurst))
+
+def download_project_in_worker(project_name):
+	"""
+	Downloads all the data of a project in a worker of a parallel crawl. Progress bars are
+	disabled, and the messages are prefixed by the name of the project.
+
+	:param project_name: the name of the projects of which the data are downloaded.
+	"""
+	download_project(project_name, worker.db, Logger(min(verbose, 1), prefix = "[" + project_name + "] "), worker.jd)
+
+def download_projects(project_names, num_workers = 1, mode = "threads"):
+	"""
+	Downloads the data of multiple projects. If num_workers is larger than 1, then the projects are
+	downloaded concurrently by a pool of workers (either threads or processes), each having its own
+	DB manager, downloader, and logger. In this case, a failed project does not stop the others.
+	The metrics of the crawl are written while it runs, if their files are set in the properties.
+
+	:param project_names: the names of the projects, in the order they are downloaded.
+	:param num_workers: the number of projects that are downloaded concurrently.
+	:param mode: "threads" for downloading in threads that share a rate limiter, or "processes" for
+	             downloading in processes that split the rate limit evenly.
+	"""
+	if num_workers <= 1 or mode != "processes":
+		metrics.start(metrics_jsonl_path, metrics_prometheus_path, metrics_interval_in_seconds)
+	try:
+		if num_workers <= 1:
+			db = create_db_manager()
+			lg = Logger(verbose)
+			jd = create_jira_downloader(RateLimiter(JiraRequestsPerSecond, JiraRequestBurst))
+			for project_name in project_names:
+				download_project(project_name, db, lg, jd)
+			return
+
+		if mode == "processes":
+			executor = ProcessPoolExecutor(max_workers = num_workers, mp_context = multiprocessing.get_context("spawn"),
+										   initializer = initialize_worker, initargs = (None, JiraRequestsPerSecond / num_workers, True))
+		else:
+			executor = ThreadPoolExecutor(max_workers = num_workers, initializer = initialize_worker,
+										  initargs = (RateLimiter(JiraRequestsPerSecond, JiraRequestBurst), JiraRequestsPerSecond))
+		failed_projects = []
+		with executor:
+			futures = {executor.submit(download_project_in_worker, project_name): project_name for project_name in project_names}
+			for future in as_completed(futures):
+				try:
+					future.result()
+				except BaseException as e:
+					failed_projects.append(futures[future])
+					sys.stderr.write("[" + futures[future] + "] " + str(e) + "\n")
+		if failed_projects:
+			sys.exit("Failed to download projects: " + ", ".join(failed_projects))
+	finally:
+		metrics.stop()
+
 if __name__ == "__main__":
 	if ((not sys.argv) or len(sys.argv) <= 1):
 		print_usage()
 	elif(os.path.exists(sys.argv[1])):
-		projects = read_file_in_lines(sys.argv[1])
-		for project in projects:
-			download_project(project)
+		if parallel_projects > 1:
+			# Start from the largest projects, so that the long tail of small projects runs in parallel with them
+			download_projects(read_projects_by_size(sys.argv[1]), parallel_projects, parallel_projects_mode)
+		else:
+			download_projects(read_file_in_lines(sys.argv[1]))
 	elif(len(sys.argv[1]) > 0):
-		download_project(sys.argv[1])
+		download_projects([sys.argv[1]])
 	else:
 		print_usage()
-
@@ -0,0 +1,154 @@
+import os
+import sys
+import threading
+import traceback
+import multiprocessing
+from datetime import datetime, UTC
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pipeline import ProducerThread, ConsumerThread
+from logger.downloadlogger import Logger
+from downloader.jsondecoder import decode_json
+from jidownloader import create_db_manager, process_issue, write_records, field_cache, page_archive
+from helpers import read_file_in_lines, compile_field_converters
+from properties import JiraAPI, verbose, pipeline_queue_size, reprocess_workers
+
+# The DB manager of each worker of a parallel reprocessing
+worker = threading.local()
+
+def read_pages(project_name, crawl):
+	"""
+	Reads and decodes the archived pages of issues of a crawl.
+
+	:param project_name: the name of the project.
+	:param crawl: the start time of the crawl.
+	:returns: a generator containing the decoded pages.
+	"""
+	for _, body in page_archive.read(project_name, crawl, "search"):
+		yield decode_json(body)
+
+def reprocess_project(project_name, db, lg):
+	"""
+	Processes again all the archived crawls of a project, in chronological order, and writes the
+	resulting data to the DB manager as if they were downloaded, without sending any request to the
+	Jira server. The fields of the issues are given by the field cache.
+
+	:param project_name: the name of the project.
+	:param db: the DB manager where the data are written.
+	:param lg: the logger of the reprocessing.
+	"""
+	crawls = page_archive.crawls(project_name)
+	if len(crawls) == 0:
+		lg.log_action("Project " + project_name + " is not archived! Skipping...")
+		return
+	fields = field_cache.read_issue_fields(JiraAPI + "field")
+	if fields == None:
+		sys.exit("The fields of the Jira instance are not cached! Run a crawl of " + JiraAPI + " with field_cache_path set first.")
+
+	lg.log_action("Reprocessing project " + project_name + " from " + str(len(crawls)) + " archived crawls")
+	db.initialize_write_to_disk(project_name)
+	project = db.read_project_from_disk(project_name)
+
+	# The project keeps the time and the status of its last archived crawl
+	crawldatetime = datetime.strptime(crawls[-1], "%Y%m%dT%H%M%S").replace(tzinfo = UTC)
+	lastcrawlcomplete = False
+	pages = None
+	writer = None
+	nonnullfields = set(project["info"].get("nonnullfields", [])) if project["info"] else set()
+	try:
+		fieldids, fieldtypes = fields
+		fieldconverters = compile_field_converters(fieldids, fieldtypes)
+
+		lg.start_action("Reprocessing " + str(len(crawls)) + " crawls...", len(crawls))
+		# The pages are read and decoded, processed, and written in separate threads, connected by bounded queues
+		writer = ConsumerThread(partial(write_records, project_name), pipeline_queue_size)
+		for crawl in crawls:
+			for _, body in page_archive.read(project_name, crawl, "project"):
+				project.add_info(decode_json(body))
+				# The archived info replaces the stored one, so the non-null fields of the stored issues are put back
+				project["info"]["nonnullfields"] = sorted(nonnullfields)
+				db.write_project_info_to_disk(project_name, project["info"])
+			# The full changelogs of the issues with truncated changelogs are archived separately; they are kept encoded and decoded
+			# whenever they are used, since an issue may appear more than once in a crawl (e.g. when two crawls started in the same
+			# second, or when a crawl was resumed) and its events are modified when processed
+			changelogs = {header["key"]: body for header, body in page_archive.read(project_name, crawl, "changelog")}
+			pages = ProducerThread(read_pages(project_name, crawl), pipeline_queue_size)
+			for page in pages:
+				writes = []
+				for issue in page["issues"]:
+					histories = decode_json(changelogs[issue["key"]])["changelog"]["histories"] if issue["key"] in changelogs else issue["changelog"]["histories"]
+					process_issue(project, db, issue, fieldids, fieldconverters, nonnullfields, writes, histories)
+				writer.put(writes)
+			lg.step_action()
+		writer.close()
+		lg.end_action()
+		lastcrawlcomplete = page_archive.contains(project_name, crawls[-1], "complete")
+	except Exception:
+		# Catch any exception and print it before exiting
+		lastcrawlcomplete = False
+		sys.exit(traceback.format_exc())
+	finally:
+		# This line of code is always executed even if an exception occurs
+		if pages != None:
+			pages.stop()
+		if writer != None:
+			writer.stop()
+		if project["info"]:
+			# Also keep the non-null fields of the issues that were written before a failure
+			project["info"]["nonnullfields"] = sorted(nonnullfields)
+		db.finalize_write_to_disk(project_name, project, crawldatetime, lastcrawlcomplete)
+
+def initialize_worker():
+	"""
+	Initializes a worker of a parallel reprocessing, creating its own DB manager.
+	"""
+	worker.db = create_db_manager()
+
+def reprocess_project_in_worker(project_name):
+	"""
+	Processes again a project in a worker of a parallel reprocessing. Progress bars are disabled,
+	and the messages are prefixed by the name of the project.
+
+	:param project_name: the name of the project.
+	"""
+	reprocess_project(project_name, worker.db, Logger(min(verbose, 1), prefix = "[" + project_name + "] "))
+
+def reprocess_projects(project_names, num_workers = 1):
+	"""
+	Processes again the archived crawls of multiple projects. If num_workers is larger than 1, then
+	the projects are processed in parallel by a pool of processes (so that they use multiple CPU cores),
+	each having its own DB manager and logger. In this case, a failed project does not stop the others.
+
+	:param project_names: the names of the projects, in the order they are processed.
+	:param num_workers: the number of projects that are processed in parallel.
+	"""
+	if page_archive == None:
+		sys.exit("There is no archive to reprocess! Set page_archive_path in the properties.")
+	if num_workers <= 1:
+		db = create_db_manager()
+		lg = Logger(verbose)
+		for project_name in project_names:
+			reprocess_project(project_name, db, lg)
+		return
+
+	failed_projects = []
+	with ProcessPoolExecutor(max_workers = num_workers, mp_context = multiprocessing.get_context("spawn"), initializer = initialize_worker) as executor:
+		futures = {executor.submit(reprocess_project_in_worker, project_name): project_name for project_name in project_names}
+		for future in as_completed(futures):
+			try:
+				future.result()
+			except BaseException as e:
+				failed_projects.append(futures[future])
+				sys.stderr.write("[" + futures[future] + "] " + str(e) + "\n")
+	if failed_projects:
+		sys.exit("Failed to reprocess projects: " + ", ".join(failed_projects))
+
+if __name__ == "__main__":
+	if len(sys.argv) <= 1:
+		# Start from the largest archives, so that the long tail of small projects runs in parallel with them
+		project_names = page_archive.projects() if page_archive != None else []
+	elif os.path.exists(sys.argv[1]):
+		project_names = read_file_in_lines(sys.argv[1])
+	else:
+		project_names = [sys.argv[1]]
+	reprocess_projects(project_names, reprocess_workers or os.cpu_count())
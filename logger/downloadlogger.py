@@ -4,16 +4,18 @@ class Logger:
 	"""
 	Class that implements a logger for the actions of this tool.
 	"""
-	def __init__(self, verbose, logto = sys.stdout):
+	def __init__(self, verbose, logto = sys.stdout, prefix = ""):
 		"""
 		Initializes this logger. The verbose argument can be set to 0 for no messages,
 		1 for simple messages, and 2 for progress bars.
 
 		:param verbose: integer denoting the amount of output to be logged.
 		:param logto: buffer where messages are logged.
+		:param prefix: a string that is prepended to all messages (e.g. the name of a project).
 		"""
 		self.verbose = verbose
 		self.logto = logto
+		self.prefix = prefix
 		self.current_action_length = None
 		self.current_action_step = 0
 		self.last_print_action_step = 0
@@ -25,7 +27,7 @@ class Logger:
 		:param action: the message of the action to be logged.
 		"""
 		if self.verbose == 1 or self.verbose == 2:
-			self.logto.write(action + "\n")
+			self.logto.write(self.prefix + action + "\n")
 
 	def start_action(self, action, current_action_length = None):
 		"""
@@ -39,7 +41,7 @@ class Logger:
 		self.current_action_step = 0
 		self.last_print_action_step = 0
 		if self.verbose == 1 or self.verbose == 2:
-			self.logto.write("\n" + action + "\n")
+			self.logto.write("\n" + self.prefix + action + "\n")
 
 	def step_action(self):
 		"""
@@ -63,6 +65,6 @@ class Logger:
 		Logs the end of an action (either single or multi-step).
 		"""
 		if self.verbose == 1:
-			self.logto.write("Done!\n")
+			self.logto.write(self.prefix + "Done!\n")
 		elif self.verbose == 2:
 			self.logto.write("\nDone!\n")
@@ -0,0 +1,201 @@
+import os
+import json
+import atexit
+import threading
+from datetime import datetime, UTC
+
+# The upper bounds of the buckets of the histograms, in seconds
+default_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Metrics:
+	"""
+	Class that implements a registry of the metrics of this tool, i.e. counters (e.g. the number of
+	requests) and histograms (e.g. the latency of the requests), each one identified by its name and
+	its labels. The metrics can be written periodically by a background thread as JSON lines (one line
+	with all the metrics per interval) and as a text file in the Prometheus exposition format (e.g. for
+	the textfile collector of the node exporter), which is replaced atomically.
+	"""
+	def __init__(self, buckets = default_buckets):
+		"""
+		Initializes this registry.
+
+		:param buckets: the upper bounds of the buckets of the histograms.
+		"""
+		self.buckets = buckets
+		self.counters = {}
+		self.histograms = {}
+		self.constant_labels = {}
+		self.lock = threading.Lock()
+		self.jsonl_filename = None
+		self.prometheus_filename = None
+		self.thread = None
+		self.stopped = threading.Event()
+
+	def increment(self, name, value = 1, **labels):
+		"""
+		Increments a counter.
+
+		:param name: the name of the counter.
+		:param value: the amount that is added to the counter.
+		:param labels: the labels of the counter.
+		"""
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			self.counters[key] = self.counters.get(key, 0) + value
+
+	def observe(self, name, value, **labels):
+		"""
+		Adds an observation (e.g. a duration in seconds) to a histogram.
+
+		:param name: the name of the histogram.
+		:param value: the observed value.
+		:param labels: the labels of the histogram.
+		"""
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			histogram = self.histograms.get(key)
+			if histogram == None:
+				histogram = self.histograms[key] = {"count": 0, "sum": 0, "buckets": [0] * len(self.buckets)}
+			histogram["count"] += 1
+			histogram["sum"] += value
+			for i, bound in enumerate(self.buckets):
+				if value <= bound:
+					histogram["buckets"][i] += 1
+					break
+
+	def snapshot(self):
+		"""
+		Returns the current values of all the metrics.
+
+		:returns: a dict containing the time, the counters, and the histograms (with cumulative buckets).
+		"""
+		with self.lock:
+			counters = [{"name": name, "labels": dict(self.constant_labels, **dict(labels)), "value": value}
+						for (name, labels), value in sorted(self.counters.items())]
+			histograms = []
+			for (name, labels), histogram in sorted(self.histograms.items()):
+				cumulative, buckets = 0, []
+				for bound, count in zip(self.buckets, histogram["buckets"]):
+					cumulative += count
+					buckets.append([bound, cumulative])
+				histograms.append({"name": name, "labels": dict(self.constant_labels, **dict(labels)), "count": histogram["count"],
+								   "sum": histogram["sum"], "buckets": buckets})
+		return {"time": datetime.now(UTC).isoformat(timespec = "seconds"), "counters": counters, "histograms": histograms}
+
+	def write_json_line(self, filename, snapshot):
+		"""
+		Appends a snapshot of the metrics to a JSON-lines file.
+
+		:param filename: the path to the file.
+		:param snapshot: the snapshot as returned by the method snapshot.
+		"""
+		with open(filename, 'a', encoding = 'utf-8') as outfile:
+			outfile.write(json.dumps(snapshot) + "\n")
+
+	def write_prometheus(self, filename, snapshot):
+		"""
+		Writes a snapshot of the metrics to a text file in the Prometheus exposition format. The file is
+		replaced atomically, so that a scraper never reads a partially written file.
+
+		:param filename: the path to the file.
+		:param snapshot: the snapshot as returned by the method snapshot.
+		"""
+		lines = []
+		for metric_type, metrics in (("counter", snapshot["counters"]), ("histogram", snapshot["histograms"])):
+			previous_name = None
+			for metric in metrics:
+				if metric["name"] != previous_name:
+					lines.append("# TYPE " + metric["name"] + " " + metric_type)
+					previous_name = metric["name"]
+				if metric_type == "counter":
+					lines.append(metric["name"] + format_labels(metric["labels"]) + " " + repr(float(metric["value"])))
+					continue
+				for bound, count in metric["buckets"]:
+					lines.append(metric["name"] + "_bucket" + format_labels(dict(metric["labels"], le = repr(float(bound)))) + " " + str(count))
+				lines.append(metric["name"] + "_bucket" + format_labels(dict(metric["labels"], le = "+Inf")) + " " + str(metric["count"]))
+				lines.append(metric["name"] + "_sum" + format_labels(metric["labels"]) + " " + repr(float(metric["sum"])))
+				lines.append(metric["name"] + "_count" + format_labels(metric["labels"]) + " " + str(metric["count"]))
+		with open(filename + ".tmp", 'w', encoding = 'utf-8') as outfile:
+			outfile.write("\n".join(lines) + "\n")
+		os.replace(filename + ".tmp", filename)
+
+	def write(self):
+		"""
+		Writes the metrics to the files given when this registry was started.
+		"""
+		snapshot = self.snapshot()
+		if self.jsonl_filename != None:
+			self.write_json_line(self.jsonl_filename, snapshot)
+		if self.prometheus_filename != None:
+			self.write_prometheus(self.prometheus_filename, snapshot)
+
+	def start(self, jsonl_filename, prometheus_filename, interval_in_seconds, process_name = None):
+		"""
+		Starts writing the metrics every interval_in_seconds seconds in a background thread. The metrics
+		are also written when this registry is stopped, or when the process exits.
+
+		:param jsonl_filename: the path to the JSON-lines file, or None to not write it.
+		:param prometheus_filename: the path to the Prometheus text file, or None to not write it.
+		:param interval_in_seconds: the interval between two writes.
+		:param process_name: the name of the process (e.g. its id) when several processes write metrics, which is added
+		                     to the names of the files (before their extensions) and as the label "process" of all metrics.
+		"""
+		if (jsonl_filename == None and prometheus_filename == None) or self.thread != None:
+			return
+		if process_name != None:
+			jsonl_filename = add_to_filename(jsonl_filename, process_name)
+			prometheus_filename = add_to_filename(prometheus_filename, process_name)
+			self.constant_labels = {"process": process_name}
+		self.jsonl_filename = jsonl_filename
+		self.prometheus_filename = prometheus_filename
+		self.stopped.clear()
+		self.thread = threading.Thread(target = self.write_periodically, args = (interval_in_seconds, ), daemon = True)
+		self.thread.start()
+		atexit.register(self.stop)
+
+	def write_periodically(self, interval_in_seconds):
+		"""
+		Writes the metrics every interval_in_seconds seconds until this registry is stopped.
+
+		:param interval_in_seconds: the interval between two writes.
+		"""
+		while not self.stopped.wait(interval_in_seconds):
+			self.write()
+
+	def stop(self):
+		"""
+		Stops writing the metrics periodically, and writes them one last time.
+		"""
+		if self.thread != None:
+			self.stopped.set()
+			self.thread.join()
+			self.thread = None
+			self.write()
+
+def format_labels(labels):
+	"""
+	Formats the labels of a metric in the Prometheus exposition format.
+
+	:param labels: a dict containing the names of the labels as keys and their values as values.
+	:returns: the formatted labels, e.g. {endpoint="search",status="200"}, or an empty string if there are no labels.
+	"""
+	if not labels:
+		return ""
+	escape = lambda value: str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+	return "{" + ",".join(name + "=\"" + escape(value) + "\"" for name, value in sorted(labels.items())) + "}"
+
+def add_to_filename(filename, suffix):
+	"""
+	Adds a suffix to a filename before its extension, e.g. metrics.prom becomes metrics.1234.prom.
+
+	:param filename: the filename, or None.
+	:param suffix: the suffix.
+	:returns: the new filename, or None if filename is None.
+	"""
+	if filename == None:
+		return None
+	root, extension = os.path.splitext(filename)
+	return root + "." + str(suffix) + extension
+
+# The metrics of this process, shared by the downloaders, the crawls, and the DB managers
+metrics = Metrics()
@@ -0,0 +1,131 @@
+import queue
+import threading
+
+# Marks the end of the items of a queue
+END_OF_ITEMS = object()
+
+class ProducerThread(threading.Thread):
+	"""
+	Class that implements the first stage of a pipeline, that is a thread that iterates over a generator
+	(e.g. the pages of a download) and puts its items in a bounded queue, so that the generator runs
+	ahead of the consumer of the items by at most max_items items. The items are consumed by iterating
+	over this object, and any exception of the generator is raised to the consumer.
+	"""
+	def __init__(self, items, max_items):
+		"""
+		Initializes this thread and starts it.
+
+		:param items: the generator of the items.
+		:param max_items: the maximum number of items that are produced but not consumed yet.
+		"""
+		super().__init__(daemon = True)
+		self.items = items
+		self.queue = queue.Queue(max_items)
+		self.stopped = threading.Event()
+		self.start()
+
+	def run(self):
+		"""
+		Puts the items of the generator in the queue, followed by END_OF_ITEMS.
+		"""
+		try:
+			for item in self.items:
+				if not self.put((item, None)):
+					return
+		except BaseException as e:
+			self.put((None, e))
+			return
+		self.put((END_OF_ITEMS, None))
+
+	def put(self, entry):
+		"""
+		Puts an entry in the queue, waiting while the queue is full, unless this thread is stopped.
+
+		:param entry: a tuple containing an item and an exception (or None).
+		:returns: True if the entry is put in the queue, or False if this thread is stopped.
+		"""
+		while not self.stopped.is_set():
+			try:
+				self.queue.put(entry, timeout = 0.1)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def __iter__(self):
+		while True:
+			item, error = self.queue.get()
+			if error != None:
+				raise error
+			if item is END_OF_ITEMS:
+				return
+			yield item
+
+	def stop(self):
+		"""
+		Stops this thread, e.g. if the consumer of the items fails, and waits for it to finish.
+		"""
+		self.stopped.set()
+		self.join()
+
+class ConsumerThread(threading.Thread):
+	"""
+	Class that implements the last stage of a pipeline, that is a thread that calls a function for each
+	item that is put in a bounded queue, in the order of the items. If the function raises an exception,
+	then the remaining items are discarded and the exception is raised by the next call of put or close.
+	"""
+	def __init__(self, function, max_items):
+		"""
+		Initializes this thread and starts it.
+
+		:param function: the function that is called for each item.
+		:param max_items: the maximum number of items that are put but not consumed yet.
+		"""
+		super().__init__(daemon = True)
+		self.function = function
+		self.queue = queue.Queue(max_items)
+		self.error = None
+		self.closed = False
+		self.start()
+
+	def run(self):
+		"""
+		Calls the function for each item of the queue, until END_OF_ITEMS is found.
+		"""
+		while True:
+			item = self.queue.get()
+			if item is END_OF_ITEMS:
+				return
+			if self.error == None:
+				try:
+					self.function(item)
+				except BaseException as e:
+					self.error = e
+
+	def put(self, item):
+		"""
+		Puts an item in the queue, waiting while the queue is full.
+
+		:param item: the item to be consumed.
+		"""
+		if self.error != None:
+			raise self.error
+		self.queue.put(item)
+
+	def stop(self):
+		"""
+		Waits for this thread to consume all the items that are put and to finish.
+		"""
+		if not self.closed:
+			self.closed = True
+			self.queue.put(END_OF_ITEMS)
+		self.join()
+
+	def close(self):
+		"""
+		Waits for this thread to consume all the items that are put and to finish, and raises the
+		exception of the function if any.
+		"""
+		self.stop()
+		if self.error != None:
+			raise self.error
@@ -0,0 +1,392 @@
+import re
+import sys
+import json
+import time
+import hashlib
+import random
+import argparse
+import threading
+from datetime import datetime, timedelta, UTC
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class JiraStubServer:
+	"""
+	Class that implements a local HTTP server that mimics the endpoints of the Jira API v2 that
+	are used by this tool (project, field and search). The served projects are synthetic, and
+	they are generated deterministically given their keys and their number of issues, so that
+	the same server configuration always returns the same data. The server can also inject latency
+	and throttling (HTTP 429) responses, so that the behavior of the tool under load can be measured.
+	"""
+	def __init__(self, projects, host = "127.0.0.1", port = 0, seed = 0, latency_in_seconds = 0, throttle_ratio = 0, retry_after_in_seconds = None):
+		"""
+		Initializes this stub server. The server is not started until the method start is called.
+
+		:param projects: a dict containing the keys of the served projects as keys and their number of issues as values.
+		:param host: the host where the server listens.
+		:param port: the port where the server listens, default is any free port.
+		:param seed: the seed of the generator of the synthetic data.
+		:param latency_in_seconds: the time that the server waits before responding to each request.
+		:param throttle_ratio: the ratio of the requests that are throttled, i.e. responded with HTTP 429.
+		:param retry_after_in_seconds: the value of the Retry-After header of the throttled requests, default is no header.
+		"""
+		self.projects = projects
+		self.seed = seed
+		self.latency_in_seconds = latency_in_seconds
+		self.throttle_ratio = throttle_ratio
+		self.retry_after_in_seconds = retry_after_in_seconds
+		self.throttle_rng = random.Random(seed)
+		self.lock = threading.Lock()
+		self.num_requests = 0
+		self.num_throttled_requests = 0
+		self.issues_updated = {}
+		self.httpserver = ThreadingHTTPServer((host, port), JiraStubRequestHandler)
+		self.httpserver.daemon_threads = True
+		self.httpserver.stub = self
+		self.jira_url = "http://%s:%d/rest/api/2/" % self.httpserver.server_address[:2]
+		self.thread = None
+
+	def start(self):
+		"""
+		Starts serving requests in a background thread.
+
+		:returns: this server.
+		"""
+		self.thread = threading.Thread(target = self.httpserver.serve_forever, daemon = True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		"""
+		Stops serving requests and closes the server socket.
+		"""
+		self.httpserver.shutdown()
+		self.httpserver.server_close()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.stop()
+
+	def throttle(self):
+		"""
+		Counts a request and decides whether it is throttled. The decisions are drawn from a random
+		generator seeded by the seed of the server, so that the same ratio of requests is throttled.
+
+		:returns: True if the request is throttled, or False otherwise.
+		"""
+		with self.lock:
+			self.num_requests += 1
+			if self.throttle_ratio > 0 and self.throttle_rng.random() < self.throttle_ratio:
+				self.num_throttled_requests += 1
+				return True
+			return False
+
+	def get_fields(self):
+		"""
+		Returns the fields of the Jira instance.
+
+		:returns: a list containing the fields.
+		"""
+		return [
+			{"id": "summary", "name": "Summary", "custom": False, "schema": {"type": "string", "system": "summary"}},
+			{"id": "description", "name": "Description", "custom": False, "schema": {"type": "string", "system": "description"}},
+			{"id": "created", "name": "Created", "custom": False, "schema": {"type": "datetime", "system": "created"}},
+			{"id": "updated", "name": "Updated", "custom": False, "schema": {"type": "datetime", "system": "updated"}},
+			{"id": "resolutiondate", "name": "Resolved", "custom": False, "schema": {"type": "datetime", "system": "resolutiondate"}},
+			{"id": "project", "name": "Project", "custom": False, "schema": {"type": "project", "system": "project"}},
+			{"id": "reporter", "name": "Reporter", "custom": False, "schema": {"type": "user", "system": "reporter"}},
+			{"id": "assignee", "name": "Assignee", "custom": False, "schema": {"type": "user", "system": "assignee"}},
+			{"id": "labels", "name": "Labels", "custom": False, "schema": {"type": "array", "items": "string", "system": "labels"}},
+			{"id": "comment", "name": "Comment", "custom": False, "schema": {"type": "comments-page", "system": "comment"}},
+			{"id": "worklog", "name": "Log Work", "custom": False, "schema": {"type": "array", "items": "worklog", "system": "worklog"}},
+			{"id": "customfield_10000", "name": "Description", "custom": True, "schema": {"type": "string", "custom": "com.atlassian.jira.plugin.system.customfieldtypes:textarea", "customId": 10000}},
+			{"id": "customfield_10001", "name": "Story Points", "custom": True, "schema": {"type": "number", "custom": "com.atlassian.jira.plugin.system.customfieldtypes:float", "customId": 10001}},
+			{"id": "customfield_10002", "name": "Number of attachments", "custom": True, "schema": {"type": "number", "custom": "com.atlassian.jira.plugin.system.customfieldtypes:importid", "customId": 10002}},
+			{"id": "customfield_10003", "name": "Last public comment date", "custom": True, "schema": {"type": "datetime", "custom": "com.atlassian.jira.ext.charting:lastpubliccommentdate", "customId": 10003}},
+			{"id": "customfield_10004", "name": "Flags", "custom": True, "schema": {"type": "array", "items": "option", "custom": "com.atlassian.jira.plugin.system.customfieldtypes:multicheckboxes", "customId": 10004}},
+		]
+
+	def get_project(self, project_key):
+		"""
+		Returns the details of a project.
+
+		:param project_key: the key of the project.
+		:returns: the project as a dict.
+		"""
+		project_id = str(10000 + sorted(self.projects).index(project_key))
+		return {"self": self.jira_url + "project/" + project_id, "id": project_id, "key": project_key, "name": project_key.title(),
+				"description": "Synthetic project " + project_key, "lead": self.get_user(0), "projectTypeKey": "software"}
+
+	def get_user(self, index):
+		"""
+		Returns a user given its index.
+
+		:param index: the index of the user.
+		:returns: the user as a dict.
+		"""
+		name = "user" + str(index)
+		return {"self": self.jira_url + "user?username=" + name, "name": name, "key": name, "displayName": "User " + str(index), "active": True, "timeZone": "Etc/UTC"}
+
+	def get_issue(self, project_key, index):
+		"""
+		Returns an issue of a project given its index. The issue is generated from a random
+		generator seeded by the project key and the index, so it is always the same.
+
+		:param project_key: the key of the project.
+		:param index: the index of the issue in the project (starting from 0).
+		:returns: the issue as a dict, including all its fields and its full changelog.
+		"""
+		rng = random.Random("%s-%s-%d" % (self.seed, project_key, index))
+		project = self.get_project(project_key)
+		issue_id = str(int(project["id"]) * 1000000 + index + 1)
+		# The creation datetime is the first value that is drawn, so that get_issue_created computes it without generating the issue
+		created = datetime(2010, 1, 1, tzinfo=UTC) + timedelta(hours = 6 * index, seconds = rng.randrange(3600))
+		user = lambda: self.get_user(rng.randrange(50))
+		histories = []
+		timestamp = created
+		for i in range(rng.choice([0, 1, 2, 3, 5, 8, 13, 150])):
+			timestamp += timedelta(minutes = rng.randrange(1, 600))
+			histories.append({"id": issue_id + "%04d" % i, "author": user(), "created": format_datetime(timestamp),
+							  "items": [{"field": "status", "fieldtype": "jira", "from": str(i), "fromString": "Status " + str(i), "to": str(i + 1), "toString": "Status " + str(i + 1)}]})
+		comments = []
+		for i in range(rng.randrange(6)):
+			timestamp += timedelta(minutes = rng.randrange(1, 600))
+			author = user()
+			comments.append({"self": self.jira_url + "issue/" + issue_id + "/comment/" + issue_id + "%03d" % i, "id": issue_id + "%03d" % i, "author": author,
+							 "body": " ".join(rng.choice(["lorem", "ipsum", "dolor", "sit", "amet", "patch", "build", "test"]) for _ in range(rng.randrange(5, 200))),
+							 "updateAuthor": author, "created": format_datetime(timestamp), "updated": format_datetime(timestamp)})
+		worklogs = []
+		for i in range(rng.choice([0, 0, 0, 1, 2])):
+			timestamp += timedelta(minutes = rng.randrange(1, 600))
+			author = user()
+			worklogs.append({"self": self.jira_url + "issue/" + issue_id + "/worklog/" + issue_id + "%02d" % i, "id": issue_id + "%02d" % i, "issueId": issue_id,
+							 "author": author, "updateAuthor": author, "comment": "Work", "created": format_datetime(timestamp), "updated": format_datetime(timestamp),
+							 "started": format_datetime(timestamp), "timeSpent": "1h", "timeSpentSeconds": 3600})
+		fields = {
+			"summary": "Issue %d of %s" % (index + 1, project_key),
+			"description": "Description of issue %d" % (index + 1),
+			"created": format_datetime(created),
+			"updated": format_datetime(timestamp),
+			"resolutiondate": format_datetime(timestamp) if rng.random() < 0.7 else None,
+			"project": {k: project[k] for k in ("self", "id", "key", "name")},
+			"reporter": user(),
+			"assignee": user() if rng.random() < 0.8 else None,
+			"labels": rng.sample(["bug", "performance", "docs", "build", "security"], rng.randrange(3)),
+			"comment": {"comments": comments, "maxResults": len(comments), "total": len(comments), "startAt": 0},
+			"worklog": {"startAt": 0, "maxResults": 20, "total": len(worklogs), "worklogs": worklogs},
+			"customfield_10000": "Custom description %d" % (index + 1) if rng.random() < 0.3 else None,
+			"customfield_10001": float(rng.choice([1, 2, 3, 5, 8])) if rng.random() < 0.5 else None,
+			"customfield_10002": str(rng.randrange(10)),
+			"customfield_10003": format_datetime(comments[-1]["created"]) if comments else None,
+			"customfield_10004": None,
+		}
+		return {"expand": "operations,versionedRepresentations,editmeta,changelog,renderedFields", "id": issue_id,
+				"self": self.jira_url + "issue/" + issue_id, "key": "%s-%d" % (project_key, index + 1), "fields": fields,
+				"changelog": {"startAt": 0, "maxResults": len(histories), "total": len(histories), "histories": histories}}
+
+	def get_issue_updated(self, project_key, index):
+		"""
+		Returns the update datetime of an issue, which is kept after it is first computed.
+
+		:param project_key: the key of the project.
+		:param index: the index of the issue in the project (starting from 0).
+		:returns: the update datetime of the issue as a datetime object.
+		"""
+		with self.lock:
+			updated = self.issues_updated.get((project_key, index))
+		if updated == None:
+			updated = parse_datetime(self.get_issue(project_key, index)["fields"]["updated"])
+			with self.lock:
+				self.issues_updated[(project_key, index)] = updated
+		return updated
+
+	def get_issue_created(self, project_key, index):
+		"""
+		Returns the creation datetime of an issue, without generating the whole issue.
+
+		:param project_key: the key of the project.
+		:param index: the index of the issue in the project (starting from 0).
+		:returns: the creation datetime of the issue as a datetime object.
+		"""
+		rng = random.Random("%s-%s-%d" % (self.seed, project_key, index))
+		return datetime(2010, 1, 1, tzinfo=UTC) + timedelta(hours = 6 * index, seconds = rng.randrange(3600))
+
+	def get_issue_by_key(self, issue_key, fields = None, expand = None):
+		"""
+		Returns an issue given its key, as returned by the issue endpoint, i.e. including its full
+		changelog (without the limit of 100 histories per issue of the search endpoint).
+
+		:param issue_key: the key of the issue (e.g. MYPROJECT-1).
+		:param fields: the fields of the issue that are returned as a comma-separated string, default is all fields.
+		:param expand: the expanded objects of the issue as a comma-separated string.
+		:returns: the issue as a dict, or None if the issue does not exist.
+		"""
+		project_key, _, number = issue_key.rpartition("-")
+		if project_key not in self.projects or not number.isdigit() or not 0 < int(number) <= self.projects[project_key]:
+			return None
+		issue = self.get_issue(project_key, int(number) - 1)
+		if fields and fields != "*all":
+			wanted = set(fields.split(","))
+			issue["fields"] = {key: value for key, value in issue["fields"].items() if key in wanted}
+		if "changelog" not in (expand or "").split(","):
+			del issue["changelog"]
+		return issue
+
+	def search(self, jql, start_at = 0, max_results = 50, fields = None, expand = None):
+		"""
+		Searches for the issues of a project. Only the JQL clauses that this tool uses are
+		supported, that is the project and optional updatedDate and created lower bounds, and the issues
+		are always returned in the order they were created.
+
+		:param jql: the JQL query of the search.
+		:param start_at: the index of the first returned issue.
+		:param max_results: the maximum number of returned issues.
+		:param fields: the fields of the issues that are returned as a comma-separated string, default is all fields.
+		:param expand: the expanded objects of the issues as a comma-separated string.
+		:returns: the search results as a dict.
+		"""
+		match = re.search(r"project\s*=\s*'?(\w+)'?", jql)
+		project_key = match.group(1) if match else None
+		if project_key not in self.projects:
+			return None
+		indexes = range(self.projects[project_key])
+		match = re.search(r"updatedDate\s*>\s*'([^']+)'", jql)
+		if match:
+			updated_after = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M").replace(tzinfo=UTC)
+			indexes = [i for i in indexes if self.get_issue_updated(project_key, i) > updated_after]
+		match = re.search(r"created\s*>=\s*'([^']+)'", jql)
+		if match:
+			created_from = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M").replace(tzinfo=UTC)
+			indexes = [i for i in indexes if self.get_issue_created(project_key, i) >= created_from]
+		max_results = min(max_results, 1000)
+		# Only the issues of the page are generated, so that large projects are served fast
+		page = [self.get_issue(project_key, i) for i in indexes[start_at:start_at + max_results]]
+		for issue in page:
+			if fields and fields != "*all":
+				wanted = set(fields.split(","))
+				issue["fields"] = {key: value for key, value in issue["fields"].items() if key in wanted}
+			if "changelog" in (expand or "").split(","):
+				changelog = issue["changelog"]
+				changelog["histories"] = changelog["histories"][:100]
+				changelog["maxResults"] = len(changelog["histories"])
+			else:
+				del issue["changelog"]
+		return {"expand": "schema,names", "startAt": start_at, "maxResults": max_results, "total": len(indexes), "issues": page}
+
+class JiraStubRequestHandler(BaseHTTPRequestHandler):
+	"""
+	Class that handles the requests of the stub server.
+	"""
+	protocol_version = "HTTP/1.1"
+
+	def do_GET(self):
+		"""
+		Handles a GET request.
+		"""
+		stub = self.server.stub
+		if stub.latency_in_seconds > 0:
+			time.sleep(stub.latency_in_seconds)
+		if stub.throttle():
+			headers = {"Retry-After": str(stub.retry_after_in_seconds)} if stub.retry_after_in_seconds != None else None
+			self.send_json({"errorMessages": ["Rate limit exceeded"], "errors": {}}, 429, headers = headers)
+			return
+		url = urlparse(self.path)
+		query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+		path = url.path.split("/rest/api/2/", 1)[-1].strip("/")
+		if path == "field":
+			self.send_json(stub.get_fields(), use_etag = True)
+		elif path == "project":
+			self.send_json([stub.get_project(key) for key in sorted(stub.projects)])
+		elif path.startswith("project/") and path[len("project/"):] in stub.projects:
+			self.send_json(stub.get_project(path[len("project/"):]))
+		elif path.startswith("issue/"):
+			issue = stub.get_issue_by_key(path[len("issue/"):], query.get("fields"), query.get("expand"))
+			if issue == None:
+				self.send_json({"errorMessages": ["Issue Does Not Exist"], "errors": {}}, 404)
+			else:
+				self.send_json(issue)
+		elif path == "search":
+			data = stub.search(query.get("jql", ""), int(query.get("startAt", 0)), int(query.get("maxResults", 50)), query.get("fields"), query.get("expand"))
+			if data == None:
+				self.send_json({"errorMessages": ["The value for field 'project' is invalid."], "errors": {}}, 400)
+			else:
+				self.send_json(data)
+		else:
+			self.send_json({"errorMessages": ["Not found"], "errors": {}}, 404)
+
+	def send_json(self, data, status_code = 200, use_etag = False, headers = None):
+		"""
+		Sends a JSON response.
+
+		:param data: the data of the response.
+		:param status_code: the HTTP status code of the response.
+		:param use_etag: set to True to send an ETag header and to respond with HTTP 304 to matching conditional requests.
+		:param headers: a dict containing any additional headers of the response.
+		"""
+		body = json.dumps(data).encode("utf-8")
+		if use_etag:
+			etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+			if self.headers.get("If-None-Match") == etag:
+				self.send_response(304)
+				self.send_header("ETag", etag)
+				self.send_header("Content-Length", "0")
+				self.end_headers()
+				return
+		self.send_response(status_code)
+		if use_etag:
+			self.send_header("ETag", etag)
+		self.send_header("Content-Type", "application/json;charset=UTF-8")
+		self.send_header("Content-Length", str(len(body)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		"""
+		Disables the logging of requests.
+		"""
+		pass
+
+def format_datetime(value):
+	"""
+	Formats a datetime in the format of the Jira API (e.g. 2021-03-04T10:11:12.000+0000).
+
+	:param value: the datetime object, or a string that is already formatted.
+	:returns: the formatted datetime.
+	"""
+	if isinstance(value, str):
+		return value
+	return value.strftime("%Y-%m-%dT%H:%M:%S.") + "%03d" % (value.microsecond // 1000) + value.strftime("%z")
+
+def parse_datetime(value):
+	"""
+	Parses a datetime in the format of the Jira API.
+
+	:param value: the formatted datetime.
+	:returns: the datetime object.
+	"""
+	return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "Serves synthetic Jira projects over a local Jira API v2.")
+	parser.add_argument("projects", nargs = "+", help = "the served projects as KEY=NUMBER_OF_ISSUES, e.g. MYPROJECT=1000")
+	parser.add_argument("--host", default = "127.0.0.1", help = "the host where the server listens")
+	parser.add_argument("--port", type = int, default = 8080, help = "the port where the server listens")
+	parser.add_argument("--seed", type = int, default = 0, help = "the seed of the generator of the synthetic data")
+	parser.add_argument("--latency", type = float, default = 0, help = "the latency of each response in milliseconds")
+	parser.add_argument("--throttle", type = float, default = 0, help = "the ratio of the requests that are responded with HTTP 429")
+	parser.add_argument("--retry-after", type = int, default = None, help = "the value of the Retry-After header of throttled responses in seconds")
+	args = parser.parse_args()
+	projects = {}
+	for project in args.projects:
+		key, _, number_of_issues = project.partition("=")
+		projects[key] = int(number_of_issues)
+	stub = JiraStubServer(projects, args.host, args.port, args.seed, args.latency / 1000, args.throttle, args.retry_after)
+	sys.stdout.write("Serving " + ", ".join(key + " (" + str(projects[key]) + " issues)" for key in sorted(projects)) + " at " + stub.jira_url + "\n")
+	try:
+		stub.httpserver.serve_forever()
+	except KeyboardInterrupt:
+		stub.httpserver.server_close()
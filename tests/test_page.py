@@ -0,0 +1,70 @@
+import io
+import json
+import unittest
+import requests
+from downloader.jiradownloader import Page
+
+def create_streamed_response(content):
+	"""
+	Creates a streamed response of the requests library with the given body, which is read in chunks
+	of the size that is requested by the reader of the response.
+
+	:param content: the body of the response.
+	:returns: the response object.
+	"""
+	r = requests.models.Response()
+	r.status_code = 200
+	r.headers["Content-Type"] = "application/json;charset=UTF-8"
+	r.raw = io.BytesIO(content)
+	return r
+
+class TestPageIterObjects(unittest.TestCase):
+	"""
+	Tests the decoding of the objects of a streamed page one by one, splitting the page into chunks at
+	every possible position.
+	"""
+	issues = [
+		{"id": "1", "key": "AAA-1", "fields": {"summary": "Quotes \" and \\\" and \\\\", "labels": ["a", "b"]}},
+		{"id": "2", "key": "AAA-2", "fields": {"summary": "Brackets ] } [ { in a string", "description": "\\\"]}"}},
+		{"id": "3", "key": "AAA-3", "fields": {"summary": "Escapes \\u005d \\n é 😀", "nested": [{"x": [1, {"y": "}"}]}]}},
+		{"id": "4", "key": "AAA-4", "fields": {"summary": "", "empty": {}, "list": []}},
+	]
+
+	def create_page(self, content, chunk_size):
+		"""
+		Creates a page that is read from a streamed response in chunks of the given size.
+
+		:param content: the body of the response.
+		:param chunk_size: the number of bytes of each chunk.
+		:returns: the page.
+		"""
+		return Page(response = create_streamed_response(content), chunk_size = chunk_size)
+
+	def test_objects_split_across_chunks(self):
+		content = json.dumps({"startAt": 0, "maxResults": 50, "total": 4, "issues": self.issues}).encode("utf-8")
+		for chunk_size in range(1, len(content) + 1):
+			page = self.create_page(content, chunk_size)
+			self.assertEqual(list(page.iter_objects("issues")), self.issues, "chunk size " + str(chunk_size))
+			self.assertEqual(page.get_number("total"), 4)
+
+	def test_objects_with_whitespace(self):
+		content = b'{"total": 2, "issues" : [ \r\n' + json.dumps(self.issues[0], indent = 1).encode("utf-8") + \
+				  b' ,\n\t' + json.dumps(self.issues[1]).encode("utf-8") + b'\n] }'
+		for chunk_size in (1, 2, 3, 7, 64):
+			self.assertEqual(list(self.create_page(content, chunk_size).iter_objects("issues")), self.issues[:2])
+
+	def test_empty_array(self):
+		for chunk_size in (1, 5, 64):
+			self.assertEqual(list(self.create_page(b'{"total": 0, "issues": []}', chunk_size).iter_objects("issues")), [])
+
+	def test_truncated_body(self):
+		content = json.dumps({"total": 4, "issues": self.issues}).encode("utf-8")
+		start = content.find(b"[") + 1
+		for end in range(start, len(content) - 1):
+			for chunk_size in (1, 16):
+				page = self.create_page(content[:end], chunk_size)
+				with self.assertRaises(ValueError, msg = "body truncated at " + str(end)):
+					list(page.iter_objects("issues"))
+
+if __name__ == '__main__':
+	unittest.main()